@@ -3,7 +3,12 @@ from logmod import log, levels as loglevels, set_log_level
 import events
 from core import sleep, Loop, wait, fire, thread, until, Connection, UDPSocket, ConnectionClosed, ClientConnectionClosed
 from core import until_eol, send, receive, call, first, fork, fork_child, label, fork_from_thread
+from core import flush, set_watermarks, set_input_limit, SendBufferFull
+from core import spawn_task, spawn_child_task
+from core import deadline, time_left, DeadlineExceeded
 from core import ParentDiedException, ClientConnectionError, TerminateLoop, datagram
+from buffer import BufferLimitExceeded
+from pipeline import FileRange
 from app import Application, Service, UDPService, quickstart, quickstop, Thunk
 from client import Client, UDPClient
 from resolver import resolve_dns_name, DNSResolutionError
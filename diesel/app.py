@@ -4,6 +4,9 @@
 import os
 import gc
 import cProfile
+import multiprocessing
+import signal
+import time
 from OpenSSL import SSL
 import socket
 import traceback
@@ -15,18 +18,33 @@ from diesel import log, Connection, UDPSocket, Loop
 from diesel.security import ssl_async_handshake
 from diesel import runtime
 from diesel.events import WaitPool
+from diesel.syscall import set_cpu_affinity
 
 
 YES_PROFILE = ['1', 'on', 'true', 'yes']
 
+# Linux's value; Python 2's socket module doesn't define it
+SO_REUSEPORT = getattr(socket, 'SO_REUSEPORT', 15)
+
 class ApplicationEnd(Exception): pass
 
 class Application(object):
     '''The Application represents diesel's main loop--
     the coordinating entity that runs all Services, Loops,
     Client protocol work, etc.
+
+    With `workers=N`, run() forks N worker processes, each running
+    its own hub, and supervises them: a worker that crashes is
+    restarted.  Workers share the listening sockets bound before the
+    fork, or, with `reuseport=True`, each binds its own with
+    SO_REUSEPORT and the kernel spreads connections across them.
+    `cpu_affinity=True` pins worker n to CPU n (modulo the CPU count);
+    a list of CPU numbers may be given instead.
     '''
-    def __init__(self, allow_app_replacement=False):
+    RESTART_DELAY = 1.0
+
+    def __init__(self, allow_app_replacement=False, workers=None,
+            reuseport=False, cpu_affinity=False):
         assert (allow_app_replacement or runtime.current_app is None), "Only one Application instance per program allowed"
         runtime.current_app = self
         self.hub = EventHub()
@@ -34,6 +52,12 @@ class Application(object):
         self._run = False
         self._services = []
         self._loops = []
+        self.workers = workers
+        self.reuseport = reuseport
+        self.cpu_affinity = cpu_affinity
+        self.worker_id = None
+        # a diesel.util.stats.CPUAccounting, when switched on
+        self.cpu_accounting = None
 
         self.running = set()
 
@@ -47,23 +71,40 @@ class Application(object):
         '''Start up an Application--blocks until the program ends
         or .halt() is called.
         '''
-        profile = os.environ.get('DIESEL_PROFILE', '').lower() in YES_PROFILE
+        if self.workers and self.worker_id is None:
+            return self._supervise()
+
+        profile_mode = os.environ.get('DIESEL_PROFILE', '').lower()
+        profile = profile_mode in YES_PROFILE
+        # DIESEL_PROFILE=sample runs the sampling profiler instead
+        sample = profile_mode == 'sample'
         track_gc = os.environ.get('TRACK_GC', '').lower() in YES_PROFILE
         track_gc_leaks = os.environ.get('TRACK_GC_LEAKS', '').lower() in YES_PROFILE
         if track_gc:
             gc.set_debug(gc.DEBUG_STATS)
         if track_gc_leaks:
             gc.set_debug(gc.DEBUG_LEAK)
+        if os.environ.get('DIESEL_CPU_ACCOUNTING', '').lower() in YES_PROFILE:
+            from diesel.util.stats import enable_cpu_accounting
+            enable_cpu_accounting(self)
+        if os.environ.get('DIESEL_HUB_METRICS', '').lower() in YES_PROFILE:
+            from diesel.util.stats import enable_hub_metrics
+            enable_hub_metrics(self)
+        stall_ms = os.environ.get('DIESEL_WATCHDOG', '')
+        if stall_ms:
+            from diesel.util import watchdog
+            watchdog.start(float(stall_ms) / 1000, self)
 
         self._run = True
         log.warning('Starting diesel <{0}>', self.hub.describe)
 
         for s in self._services:
-            s.bind_and_listen()
+            if not s.listening:
+                s.bind_and_listen()
             s.register(self)
 
         for l in self._loops:
-            self.hub.schedule(l.wake)
+            l.schedule_start()
 
         self.setup()
 
@@ -106,7 +147,115 @@ class Application(object):
                 else: raise e
 
         self.runhub = greenlet(_main if not profile else _profiled_main)
-        self.runhub.switch()
+        if not sample:
+            self.runhub.switch()
+            return
+
+        from diesel.util import sampling
+        log.warning("(Profiling with the sampling profiler)")
+        sampling.start()
+        try:
+            self.runhub.switch()
+        finally:
+            sampling.stop()
+            sampling.write_collapsed(
+                    os.environ.get('DIESEL_PSTATS', None) or 'diesel.stacks')
+
+    def _supervise(self):
+        '''Fork the worker processes and keep them running until they
+        exit cleanly or the supervisor is told to stop.
+        '''
+        log.warning('Starting {0} diesel workers', self.workers)
+        for s in self._services:
+            if self.reuseport:
+                s.reuseport = True
+            else:
+                s.bind_and_listen()
+
+        children = {}
+        stopping = []
+        def stop(sig, frame):
+            stopping.append(sig)
+            for pid in children:
+                try:
+                    os.kill(pid, signal.SIGTERM)
+                except OSError:
+                    pass
+        signal.signal(signal.SIGTERM, stop)
+
+        for n in xrange(self.workers):
+            children[self._fork_worker(n)] = n
+
+        while children:
+            try:
+                pid, status = os.wait()
+            except OSError, e:
+                if e.errno == errno.EINTR:
+                    continue
+                raise
+            except KeyboardInterrupt:
+                # the workers got the SIGINT too
+                stopping.append(signal.SIGINT)
+                continue
+            n = children.pop(pid, None)
+            if n is None:
+                continue
+            if status == 0 or stopping:
+                log.info('Worker {0} (pid {1}) exited', n, pid)
+                continue
+            log.error('Worker {0} (pid {1}) died (status {2}); restarting',
+                    n, pid, status)
+            time.sleep(self.RESTART_DELAY)
+            if not stopping:
+                children[self._fork_worker(n)] = n
+        log.info('All workers exited; ending diesel application')
+        runtime.current_app = None
+
+    def _fork_worker(self, n):
+        pid = os.fork()
+        if pid:
+            return pid
+        status = 1
+        try:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            self._become_worker(n)
+            self.run()
+            status = 0
+        except SystemExit, e:
+            # as the interpreter does: sys.exit() is a clean exit
+            if e.code is None:
+                status = 0
+            elif isinstance(e.code, int):
+                status = e.code
+            else:
+                status = 1
+        except:
+            log.error("-- Unhandled Exception in worker {0} --", n)
+            log.error(traceback.format_exc())
+        finally:
+            os._exit(status)
+
+    def _become_worker(self, n):
+        '''Set up a freshly forked process as worker `n`.
+
+        The hub inherited from the supervisor shares its epoll
+        descriptor with every other worker, so each worker closes it
+        and gets its own before anything is registered.
+        '''
+        self.worker_id = n
+        self.hub.close()
+        self.hub = EventHub()
+        for l in self._loops:
+            l.hub = self.hub
+        if self.cpu_affinity:
+            if self.cpu_affinity is True:
+                cpus = [n % multiprocessing.cpu_count()]
+            else:
+                cpus = [self.cpu_affinity[n % len(self.cpu_affinity)]]
+            if set_cpu_affinity:
+                set_cpu_affinity(cpus)
+            else:
+                log.warning('CPU affinity is not supported on this platform')
 
     def add_service(self, service):
         '''Add a Service instance to this Application.
@@ -134,7 +283,7 @@ class Application(object):
             loop.keep_alive = True
 
         if self._run:
-            self.hub.schedule(loop.wake)
+            loop.schedule_start()
         else:
             if front:
                 self._loops.insert(0, loop)
@@ -174,6 +323,7 @@ class Service(object):
         self.application = None
         self.ssl_ctx = ssl_ctx
         self.track = track
+        self.reuseport = False
         # Call this last so the connection_handler has a fully-instantiated
         # Service instance at its disposal.
         if hasattr(connection_handler, 'on_service_init'):
@@ -196,6 +346,8 @@ class Service(object):
     def bind_and_listen(self):
         sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if self.reuseport:
+            sock.setsockopt(socket.SOL_SOCKET, SO_REUSEPORT, 1)
         sock.setblocking(0)
 
         try:
@@ -251,6 +403,8 @@ class UDPService(Service):
         sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         # unsure if the following two lines are necessary for UDP
         sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if self.reuseport:
+            sock.setsockopt(socket.SOL_SOCKET, SO_REUSEPORT, 1)
         sock.setblocking(0)
 
         try:
@@ -259,13 +413,12 @@ class UDPService(Service):
             self.handle_cannot_bind(str(e))
 
         self.sock = sock
-        c = UDPSocket(self, sock)
-        l = Loop(self.connection_handler)
-        l.connection_stack.append(c)
-        runtime.current_app.add_loop(l)
 
     def register(self, app):
-        pass
+        c = UDPSocket(self, self.sock)
+        l = Loop(self.connection_handler)
+        l.connection_stack.append(c)
+        app.add_loop(l)
 
 
 def quickstart(*args, **kw):
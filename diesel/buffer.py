@@ -2,26 +2,52 @@
 class BufAny(object):
     pass
 
+class BufferLimitExceeded(Exception):
+    '''Raised when more than the allowed number of bytes arrive
+    without the sentinel being found.
+    '''
+
 class Buffer(object):
     '''An input buffer.
 
     Allows socket data to be read immediately and buffered, but
     fine-grained byte-counting or sentinel-searching to be
     specified by consumers of incoming data.
+
+    Data is appended to a single bytearray, and consumed by moving a
+    read offset forward; the consumed prefix is only cut off once it
+    makes up most of the buffer.  So neither feeding nor taking a
+    message copies the rest of the buffered data.
+
+    The search for a string sentinel resumes where the last one left
+    off, so waiting on a sentinel is linear in the bytes received.
     '''
+    __slots__ = ('_atbuf', '_atpos', '_atterm', '_atmax', '_atscanterm',
+            '_atscan')
+
+    COMPACT_MIN = 2 ** 16
+
     def __init__(self):
-        self._atinbuf = []
+        self._atbuf = bytearray()
+        self._atpos = 0
         self._atterm = None
-        self._atmark = 0
-        
-    def set_term(self, term):
+        self._atmax = None
+        self._atscanterm = None
+        self._atscan = 0
+
+    def set_term(self, term, max_length=None):
         '''Set the current sentinel.
 
         `term` is either an int, for a byte count, or
         a string, for a sequence of characters that needs
         to occur in the byte stream.
+
+        If `max_length` is given, a string sentinel must turn up within
+        that many bytes (counting the sentinel), or check() raises
+        BufferLimitExceeded.
         '''
         self._atterm = term
+        self._atmax = max_length
 
     def feed(self, data):
         '''Feed some data into the buffer.
@@ -29,8 +55,7 @@ class Buffer(object):
         The buffer is appended, and the check() is run in case
         this append causes the sentinel to be satisfied.
         '''
-        self._atinbuf.append(data)
-        self._atmark += len(data)
+        self._atbuf += data
         return self.check()
 
     def clear_term(self):
@@ -40,40 +65,63 @@ class Buffer(object):
         '''Look for the next message in the data stream based on
         the current sentinel.
         '''
-        ind = None
-        all = None
-        if self._atterm is BufAny:
+        term = self._atterm
+        if term is BufAny:
             if self.has_data:
                 return self.pop()
             return None
-        if type(self._atterm) is int:
-            if self._atmark >= self._atterm:
-                ind = self._atterm
-        elif self._atterm is None:
+        if term is None:
             return None
+        if type(term) is int:
+            end = self._atpos + term
+            if end > len(self._atbuf):
+                return None
         else:
-            all = ''.join(self._atinbuf)
-            res = all.find(self._atterm)
-            if res != -1:
-                ind = res + len(self._atterm)
-        if ind is None:
-            return None
+            start = self._atpos
+            if term == self._atscanterm:
+                start = max(start, self._atscan)
+            res = self._atbuf.find(term, start)
+            if res == -1:
+                # the sentinel could still straddle the end of the buffer
+                self._atscanterm = term
+                self._atscan = len(self._atbuf) - len(term) + 1
+                end = len(self._atbuf)
+            else:
+                end = res + len(term)
+            if self._atmax is not None and end - self._atpos > self._atmax:
+                self._atterm = None
+                raise BufferLimitExceeded(
+                        "no %r within %d bytes" % (term, self._atmax))
+            if res == -1:
+                return None
         self._atterm = None # this terminator was used
-        if all is None:
-            all = ''.join(self._atinbuf)
-        use = all[:ind]
-        new_all = all[ind:]
-        self._atinbuf = [new_all]
-        self._atmark = len(new_all)
+        return self._take(end)
 
+    def _take(self, end):
+        '''Consume and return the data up to offset `end`.
+        '''
+        start = self._atpos
+        use = str(buffer(self._atbuf, start, end - start))
+        self._atscanterm = None
+        if end == len(self._atbuf):
+            del self._atbuf[:]
+            self._atpos = 0
+        elif end > self.COMPACT_MIN and end * 2 > len(self._atbuf):
+            del self._atbuf[:end]
+            self._atpos = 0
+        else:
+            self._atpos = end
         return use
 
     def pop(self):
-        b = ''.join(self._atinbuf)
-        self._atinbuf = []
-        self._atmark = 0
-        return b
+        return self._take(len(self._atbuf))
 
     @property
     def has_data(self):
-        return bool(self._atinbuf)
+        return len(self._atbuf) > self._atpos
+
+    @property
+    def size(self):
+        '''The number of bytes buffered and not yet taken.
+        '''
+        return len(self._atbuf) - self._atpos
@@ -37,6 +37,7 @@ from cStringIO import StringIO
 import diesel
 
 from diesel.util import debugtools
+from diesel.util import sampling
 
 
 port = 4299
@@ -86,6 +87,7 @@ class RemoteConsoleService(diesel.Client):
         self.interpreter = BackendInterpreter({
             'diesel':diesel,
             'debugtools':debugtools,
+            'sampling':sampling,
         })
         super(RemoteConsoleService, self).__init__(*args, **kw)
 
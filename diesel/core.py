@@ -9,14 +9,16 @@ import errno
 import sys
 import itertools
 from collections import deque
+from contextlib import contextmanager
 from OpenSSL import SSL
-from greenlet import greenlet
+from greenlet import greenlet, getcurrent
 
 from diesel import pipeline
 from diesel import buffer
 from diesel.security import ssl_async_handshake
 from diesel import runtime
 from diesel import log
+from diesel.syscall import monotonic, sendfile
 from diesel.events import EarlyValue
 
 class ConnectionClosed(socket.error):
@@ -59,6 +61,16 @@ class ParentDiedException(Exception):
     '''Raised when the parent (assigned via fork_child) has died.
     '''
 
+class SendBufferFull(Exception):
+    '''Raised by send() when the connection already has more than its
+    high watermark of data waiting, and it was set not to block.
+    '''
+
+class DeadlineExceeded(Exception):
+    '''Raised by a blocking call that was still waiting when the loop's
+    deadline (set with `deadline()`) passed.
+    '''
+
 class TerminateLoop(Exception):
     '''Raised to terminate the current loop, closing the socket if there
     is one associated with the loop.
@@ -70,8 +82,8 @@ BUFSIZ = 2 ** 14
 def until(*args, **kw):
     return current_loop.input_op(*args, **kw)
 
-def until_eol():
-    return until("\r\n")
+def until_eol(max_length=None):
+    return until("\r\n", max_length=max_length)
 
 class datagram(object):
     pass
@@ -85,6 +97,15 @@ def receive(*args, **kw):
 def send(*args, **kw):
     return current_loop.send(*args, **kw)
 
+def flush(*args, **kw):
+    return current_loop.flush(*args, **kw)
+
+def set_watermarks(*args, **kw):
+    return current_loop.set_watermarks(*args, **kw)
+
+def set_input_limit(*args, **kw):
+    return current_loop.set_input_limit(*args, **kw)
+
 def wait(*args, **kw):
     return current_loop.wait(*args, **kw)
 
@@ -97,6 +118,32 @@ def sleep(*args, **kw):
 def thread(*args, **kw):
     return current_loop.thread(*args, **kw)
 
+@contextmanager
+def deadline(seconds):
+    '''Give the blocking calls in this block, in this loop and the child
+    loops it starts, until `seconds` from now to finish.
+
+    Waiting in receive(), until(), sleep(), wait(), first() (and so
+    Queue.get() and ConnectionPool.get()), send() on a full buffer or
+    a client's connect raises DeadlineExceeded once it has passed.
+    Nested deadlines can only shorten the time left.  thread() calls
+    aren't interrupted.
+    '''
+    loop = current_loop
+    old = loop.deadline
+    when = monotonic() + seconds
+    if old is None or when < old:
+        loop.deadline = when
+    try:
+        yield
+    finally:
+        loop.deadline = old
+
+def time_left():
+    '''Seconds until the current loop's deadline, or None if it has none.
+    '''
+    return current_loop.time_left()
+
 def _private_connect(*args, **kw):
     return current_loop.connect(*args, **kw)
 
@@ -112,6 +159,12 @@ def fork(*args, **kw):
 def fork_child(*args, **kw):
     return current_loop.fork(True, *args, **kw)
 
+def spawn_task(*args, **kw):
+    return current_loop.spawn_task(False, *args, **kw)
+
+def spawn_child_task(*args, **kw):
+    return current_loop.spawn_task(True, *args, **kw)
+
 def fork_from_thread(f, *args, **kw):
     l = Loop(f, *args, **kw)
     runtime.current_app.hub.schedule_loop_from_other_thread(l, ContinueNothing)
@@ -150,18 +203,26 @@ def identity(cb): return cb
 ids = itertools.count(1)
 
 class Loop(object):
+    __slots__ = ('loop_callable', '_label', 'args', 'kw', 'keep_alive',
+            'hub', 'app', 'id', 'children', 'parent', 'deaths', 'running',
+            '_wakeup_timer', 'fire_handlers', 'fire_due', 'connection_stack',
+            'coroutine', '_clock', 'clock', 'tracked', 'dispatch', 'deadline',
+            '_runnable_at', '__weakref__')
+
     def __init__(self, loop_callable, *args, **kw):
         self.loop_callable = loop_callable
-        self.loop_label = str(self.loop_callable)
+        self._label = None
         self.args = args
         self.kw = kw
         self.keep_alive = False
         self.hub = runtime.current_app.hub
         self.app = runtime.current_app
         self.id = ids.next()
-        self.children = set()
+        # children and fire_handlers are only allocated once needed
+        self.children = None
         self.parent = None
         self.deaths = 0
+        self.connection_stack = []
         self.reset()
         self._clock = 0.0
         self.clock = 0.0
@@ -171,10 +232,24 @@ class Loop(object):
     def reset(self):
         self.running = False
         self._wakeup_timer = None
-        self.fire_handlers = {}
+        self.fire_handlers = None
         self.fire_due = False
-        self.connection_stack = []
+        del self.connection_stack[:]
         self.coroutine = None
+        self.deadline = None
+        # when this loop was made runnable, if hub metrics are on
+        self._runnable_at = None
+
+    @property
+    def loop_label(self):
+        # str(loop_callable) is only worth building if someone asks
+        if self._label is None:
+            self._label = str(self.loop_callable)
+        return self._label
+
+    @loop_label.setter
+    def loop_label(self, label):
+        self._label = label
 
     def enable_tracking(self):
         self.tracked = True
@@ -207,18 +282,32 @@ class Loop(object):
         # 1) Parent loop death always kills off children.
         # 2) Child loops with keep-alive resurrect if their parent didn't die.
         # 3) If a parent has died, a child always dies.
+        # 4) A child whose parent dies while it waits to be resurrected
+        #    stays dead (see resurrect()).
         self.notify_children()
         if self.keep_alive and not parent_died:
             log.warning("(Keep-Alive loop %s died; restarting)" % self)
             self.reset()
-            self.hub.call_later(0.5, self.wake)
-        elif self.parent and self in self.parent.children:
+            self.hub.call_later(0.5, self.resurrect)
+        else:
+            self.leave_parent()
+
+    def resurrect(self):
+        if self.parent and not self.parent.running:
+            # the parent died while we were waiting to restart
+            self.leave_parent()
+            return
+        self.wake()
+
+    def leave_parent(self):
+        if self.parent and self.parent.children and self in self.parent.children:
             self.parent.children.remove(self)
             self.parent = None
 
     def notify_children(self):
-        for c in self.children:
-            c.parent_died()
+        if self.children:
+            for c in self.children:
+                c.parent_died()
 
     def __hash__(self):
         return self.id
@@ -235,28 +324,51 @@ class Loop(object):
         if self.connection_stack:
             conn = self.connection_stack[-1]
             conn.cleanup()
-        self.fire_handlers = {}
+        self.fire_handlers = None
         self.fire_due = False
         self.app.waits.clear(self)
 
     def thread(self, f, *args, **kw):
-        self.hub.run_in_thread(self.wake, f, *args, **kw)
+        self.hub.run_in_thread(self.waker(), f, *args, **kw)
         return self.dispatch()
 
     def fork(self, make_child, f, *args, **kw):
-        def wrap():
-            return f(*args, **kw)
-        l = Loop(wrap)
+        l = Loop(f, *args, **kw)
         if make_child:
-            self.children.add(l)
-            l.parent = self
-        l.loop_label = str(f)
+            self.adopt(l)
         self.app.add_loop(l, track=self.tracked)
         return l
 
+    def spawn_task(self, make_child, f, *args, **kw):
+        '''Like fork(), but run `f` on a pooled Task rather than a new
+        Loop and greenlet.
+
+        The Task is returned, but it's only `f`'s until `f` is done;
+        after that it may be running something else.
+        '''
+        t = Task.get(f, args, kw)
+        if make_child:
+            self.adopt(t)
+        if self.tracked:
+            t.enable_tracking()
+        t.schedule_start()
+        return t
+
+    def adopt(self, l):
+        if self.children is None:
+            self.children = set()
+        self.children.add(l)
+        l.parent = self
+        l.deadline = self.deadline
+
     def parent_died(self):
         if self.running:
-            self.hub.schedule(lambda: self.wake(ParentDiedException()))
+            id = self.id
+            def die():
+                # not if this loop (or Task run) has finished meanwhile
+                if self.running and self.id == id:
+                    self.wake(ParentDiedException())
+            self.hub.schedule(die)
 
     def label(self, label):
         self.loop_label = label
@@ -306,15 +418,20 @@ class Loop(object):
                 if type(v) is EarlyValue:
                     self.clear_pending_events()
                     self.reschedule_with_this_value((w, v.val))
-                    break
-        return self.dispatch()
+                    return self.dispatch()
+        if sleep is not None and sleep <= 0:
+            # already rescheduled
+            return self.dispatch()
+        return self.dispatch_until_deadline()
 
     def connect(self, client, ip, sock, host, port, timeout=None):
+        timeout_error = ClientConnectionTimeout
+        wake = self.waker()
         def cancel_callback(sock):
             self.hub.unregister(sock)
             sock.close()
-            self.hub.schedule(lambda: self.wake(
-                ClientConnectionTimeout("connection timeout (%s:%s)" % (host, port))
+            self.hub.schedule(lambda: wake(
+                timeout_error("connection timeout (%s:%s)" % (host, port))
                 ))
 
         def connect_callback():
@@ -331,13 +448,13 @@ class Loop(object):
                 if e:
                     assert isinstance(e, Exception)
                     self.hub.schedule(
-                    lambda: self.wake(e)
+                    lambda: wake(e)
                     )
                 else:
                     client.conn = Connection(fsock, ip)
                     client.connected = True
                     self.hub.schedule(
-                    lambda: self.wake()
+                    lambda: wake()
                     )
 
             if client.ssl_ctx:
@@ -354,7 +471,7 @@ class Loop(object):
                 cancel_timer.cancel()
             self.hub.unregister(sock)
             self.hub.schedule(
-            lambda: self.wake(
+            lambda: wake(
                 ClientConnectionError("odd error on connect() (%s:%s)" % (host, port))
                 ))
 
@@ -386,11 +503,21 @@ class Loop(object):
                     cancel_timer.cancel()
                 self.hub.unregister(sock)
                 self.hub.schedule(
-                lambda: self.wake(
+                lambda: wake(
                     ClientConnectionError("Could not connect to remote host (%s:%s)" % (host, port))
                     ))
                 return
 
+        # a deadline sooner than the timeout takes its place
+        left = self.time_left()
+        if left is not None:
+            if left <= 0:
+                sock.close()
+                raise DeadlineExceeded()
+            if timeout is None or left < timeout:
+                timeout = left
+                timeout_error = DeadlineExceeded
+
         cancel_timer = None
         if timeout is not None:
             cancel_timer = self.hub.call_later(timeout, cancel_callback, sock)
@@ -408,40 +535,45 @@ class Loop(object):
 
     def sleep(self, v=0):
         self._sleep(v)
+        if v > 0:
+            return self.dispatch_until_deadline()
         return self.dispatch()
 
     def _sleep(self, v, cb_maker=identity):
-        cb = lambda: cb_maker(self.wake)(True)
+        wake = self.waker()
+        cb = lambda: cb_maker(wake)(True)
         assert v >= 0
 
         if v > 0:
             self._wakeup_timer = self.hub.call_later(v, cb)
         else:
+            if self.hub.metrics is not None:
+                self._runnable_at = monotonic()
             self.hub.schedule(cb, True)
 
     def fire_in(self, what, value):
-        if what in self.fire_handlers:
+        if self.fire_handlers and what in self.fire_handlers:
             handler = self.fire_handlers[what]
-            self.fire_handlers = {}
-            handler(value)
+            self.fire_handlers = None
+            self.hub.schedule_fire(handler, value)
             self.fire_due = True
+            if self.hub.metrics is not None:
+                self._runnable_at = monotonic()
 
     def wait(self, event):
         v = self._wait(event)
         if type(v) is EarlyValue:
             self.reschedule_with_this_value(v.val)
-        return self.dispatch()
+            return self.dispatch()
+        return self.dispatch_until_deadline()
 
     def _wait(self, event, cb_maker=identity):
-        rcb = cb_maker(self.wake_fire)
-        def cb(d):
-            def call_in():
-                rcb(d)
-            self.hub.schedule(call_in)
         v = self.app.waits.wait(self, event)
         if type(v) is EarlyValue:
             return v
-        self.fire_handlers[v] = cb
+        if self.fire_handlers is None:
+            self.fire_handlers = {}
+        self.fire_handlers[v] = cb_maker(self.wake_fire)
 
     def fire(self, event, value=None):
         self.app.waits.fire(event, value)
@@ -470,11 +602,44 @@ class Loop(object):
         self.update_clock()
         return self._dispatch()
 
+    def dispatch_until_deadline(self):
+        '''dispatch(), but if the loop has a deadline, wake up with
+        DeadlineExceeded when it passes.
+
+        Only for waits that clear_pending_events() calls off; anything
+        else could still wake the loop after the deadline did.
+        '''
+        if self.deadline is None:
+            return self.dispatch()
+        left = self.deadline - monotonic()
+        if left <= 0:
+            self.clear_pending_events()
+            raise DeadlineExceeded()
+        t = self.hub.call_later(left, self._deadline_passed)
+        try:
+            return self.dispatch()
+        finally:
+            t.cancel()
+
+    def _deadline_passed(self):
+        self.wake(DeadlineExceeded())
+
+    def time_left(self):
+        if self.deadline is None:
+            return None
+        return max(self.deadline - monotonic(), 0.0)
+
     def wake_fire(self, value=ContinueNothing):
         assert self.fire_due, "wake_fire called when fire wasn't due!"
         self.fire_due = False
         return self.wake(value)
 
+    def waker(self):
+        '''The callable to hand out for waking this loop from whatever
+        it is about to wait on.
+        '''
+        return self.wake
+
     def wake(self, value=ContinueNothing):
         '''Wake up this loop.  Called by the main hub to resume a loop
         when it is rescheduled.
@@ -489,29 +654,42 @@ class Loop(object):
         if self.fire_due:
             return
 
+        metrics = self.hub.metrics
+        if metrics is not None and self._runnable_at is not None:
+            metrics.wake_latency.record(monotonic() - self._runnable_at)
+            self._runnable_at = None
+
         if self.coroutine is None:
             self.coroutine = greenlet(self.run)
             assert self.coroutine.parent == runtime.current_app.runhub
         self.clear_pending_events()
         current_loop = self
+        accounting = self.app.cpu_accounting
+        if accounting is not None:
+            # str(loop_callable) is left to the accounting, which only
+            # builds it once per callable per bucket
+            label = self._label or self.loop_callable
+            start = accounting.clock()
         if isinstance(value, Exception):
             self.coroutine.throw(value)
         elif value is not ContinueNothing:
             self.coroutine.switch(value)
         else:
             self.coroutine.switch()
+        if accounting is not None:
+            accounting.add(label, start)
 
-    def input_op(self, sentinel_or_receive=buffer.BufAny):
-        v = self._input_op(sentinel_or_receive)
+    def input_op(self, sentinel_or_receive=buffer.BufAny, max_length=None):
+        v = self._input_op(sentinel_or_receive, max_length=max_length)
         if v:
             return v
         else:
-            return self.dispatch()
+            return self.dispatch_until_deadline()
 
-    def _input_op(self, sentinel, cb_maker=identity):
+    def _input_op(self, sentinel, cb_maker=identity, max_length=None):
         conn = self.check_connection()
-        cb = cb_maker(self.wake)
-        res = conn.check_incoming(sentinel, cb)
+        cb = cb_maker(self.waker())
+        res = conn.check_incoming(sentinel, cb, max_length)
         if callable(res):
             cb = res
         elif res:
@@ -530,32 +708,196 @@ class Loop(object):
 
     def send(self, o, priority=5):
         conn = self.check_connection()
+        if conn.high_water is not None and conn.pipeline.size > conn.high_water:
+            if not conn.block_on_high_water:
+                raise SendBufferFull("%d bytes waiting to be sent" %
+                        conn.pipeline.size)
+            self._wait_for_write(conn, conn.low_water)
         conn.queue_outgoing(o, priority)
         conn.set_writable(True)
 
+    def flush(self):
+        '''Wait until everything sent so far has been handed to the
+        socket.
+        '''
+        conn = self.check_connection()
+        if not conn.pipeline.empty:
+            self._wait_for_write(conn, None)
+
+    def _wait_for_write(self, conn, mark):
+        conn.write_waiter = self.waker()
+        conn.write_mark = mark
+        self.dispatch_until_deadline()
+
+    def set_watermarks(self, high, low=None, block=True):
+        self.check_connection().set_watermarks(high, low, block)
+
+    def set_input_limit(self, limit):
+        self.check_connection().set_input_limit(limit)
+
+    def schedule_start(self):
+        '''Have the hub start running this loop soon.
+        '''
+        if self.hub.metrics is not None:
+            self._runnable_at = monotonic()
+        self.hub.schedule(self.wake)
+
     def reschedule_with_this_value(self, value):
+        wake = self.waker()
         def delayed_call():
-            self.wake(value)
+            wake(value)
+        if self.hub.metrics is not None:
+            self._runnable_at = monotonic()
         self.hub.schedule(delayed_call, True)
 
+class Task(Loop):
+    '''A Loop for short-lived work, started by spawn_task().
+
+    When its function is done, the Task parks its greenlet in a pool
+    instead of letting it die, and a later spawn_task() gives it the
+    next function to run.  Each run gets a fresh id and label, and
+    parent/child and keep-alive behave as they do for any Loop.
+    '''
+    __slots__ = ()
+
+    POOL_SIZE = 256
+    idle = []
+
+    def waker(self):
+        # Nothing cancels a thread() job, a scheduled callback or a
+        # connection's callbacks when a run is cut short, so a wake-up
+        # meant for this run must not reach the next one.
+        id = self.id
+        def wake(value=ContinueNothing):
+            if self.running and self.id == id:
+                self.wake(value)
+        return wake
+
+    @classmethod
+    def get(cls, f, args, kw):
+        app = runtime.current_app
+        idle = cls.idle
+        while idle:
+            t = idle.pop()
+            if t.app is app:
+                t.loop_callable = f
+                t.args = args
+                t.kw = kw
+                t.id = ids.next()
+                return t
+        return cls(f, *args, **kw)
+
+    def run(self):
+        while True:
+            Loop.run(self)
+            if self.coroutine is not getcurrent():
+                # a keep-alive restart has been set up in a new greenlet
+                return
+            if len(self.idle) >= self.POOL_SIZE:
+                return
+            self.loop_callable = self.args = self.kw = None
+            self._label = None
+            self.keep_alive = False
+            self.children = None
+            self.parent = None
+            self.deadline = None
+            self.tracked = False
+            self.dispatch = self._dispatch
+            self.idle.append(self)
+            while self.loop_callable is None:
+                # parked until get() hands out more work
+                try:
+                    self.app.runhub.switch()
+                except Exception:
+                    pass # a stray wake-up for a finished run
+
 class Connection(object):
+    __slots__ = ('hub', 'pipeline', 'buffer', 'sock', '_sendmsg', '_sendfile',
+            'addr', 'drain', '_writable', 'closed', 'waiting_callback',
+            'write_waiter', 'write_mark', 'high_water', 'low_water',
+            'block_on_high_water', 'input_limit', '_reads_paused',
+            '__weakref__')
+
+    # Defaults for set_watermarks() and set_input_limit()
+    HIGH_WATER = None
+    LOW_WATER = None
+    INPUT_LIMIT = None
+
     def __init__(self, sock, addr):
         self.hub = runtime.current_app.hub
         self.pipeline = pipeline.Pipeline()
         self.buffer = buffer.Buffer()
         self.sock = sock
+        # plain sockets can gather the pipeline's buffers in one call
+        # where the platform has sendmsg(); otherwise they're joined
+        self._sendmsg = getattr(sock, 'sendmsg', None)
+        # files on disk go straight from the page cache, except over TLS
+        self._sendfile = sendfile and not isinstance(sock, SSL.Connection)
         self.addr = addr
-        self.hub.register(sock, self.handle_read, self.handle_write, self.handle_error)
+        # On an edge-triggered hub, read and write until EAGAIN (up to
+        # the hub's io_budget bytes per event) instead of once per event
+        self.drain = self.hub.edge_triggered
+        self.hub.register(sock, self.handle_read, self.handle_write,
+                self.handle_error, edge=self.drain)
         self._writable = False
         self.closed = False
         self.waiting_callback = None
+        self.write_waiter = None
+        self.write_mark = None
+        self.high_water = self.low_water = None
+        self.block_on_high_water = True
+        if self.HIGH_WATER is not None:
+            self.set_watermarks(self.HIGH_WATER, self.LOW_WATER)
+        self.input_limit = self.INPUT_LIMIT
+        self._reads_paused = False
+
+    def set_watermarks(self, high, low=None, block=True):
+        '''Limit how much unsent data can pile up on this connection.
+
+        Once more than `high` bytes are waiting, send() suspends the
+        calling loop until no more than `low` bytes (by default, half
+        of `high`) are left--or, if `block` is False, raises
+        SendBufferFull instead of queueing anything more.  Only
+        strings are counted; files are read as they're sent.
+
+        A `high` of None removes the limit.
+        '''
+        if low is None and high is not None:
+            low = high // 2
+        self.high_water = high
+        self.low_water = low
+        self.block_on_high_water = block
+
+    def set_input_limit(self, limit):
+        '''Stop reading from the socket while `limit` bytes or more
+        sit in the input buffer and the loop isn't waiting for input.
+
+        Reading resumes once the loop takes some of the data, or asks
+        for more than is there.  A `limit` of None removes the cap.
+        '''
+        self.input_limit = limit
+        if limit is None and self._reads_paused:
+            self._resume_reads()
+
+    def _pause_reads(self):
+        self._reads_paused = True
+        self.hub.disable_read(self.sock)
+
+    def _resume_reads(self):
+        self._reads_paused = False
+        if not self.closed:
+            self.hub.enable_read(self.sock)
 
     def queue_outgoing(self, msg, priority=5):
         self.pipeline.add(msg, priority)
 
-    def check_incoming(self, condition, callback):
-        self.buffer.set_term(condition)
-        return self.buffer.check()
+    def check_incoming(self, condition, callback, max_length=None):
+        self.buffer.set_term(condition, max_length)
+        res = self.buffer.check()
+        if self._reads_paused and (
+                not res or self.buffer.size < self.input_limit):
+            self._resume_reads()
+        return res
 
     def set_writable(self, val):
         '''Set the associated socket writable.  Called when there is
@@ -575,6 +917,7 @@ class Connection(object):
     def cleanup(self):
         self.buffer.clear_term()
         self.waiting_callback = None
+        self.write_waiter = None
 
     def close(self):
         self.set_writable(True)
@@ -588,6 +931,10 @@ class Connection(object):
         self.closed = True
         self.sock.close()
 
+        if self.write_waiter:
+            self.write_waiter(
+            ConnectionClosed('Connection closed before data was sent'))
+
         if remote_closed and self.waiting_callback:
             self.waiting_callback(
             ConnectionClosed('Connection closed by remote host',
@@ -597,72 +944,148 @@ class Connection(object):
         '''The low-level handler called by the event hub
         when the socket is ready for writing.
         '''
-        if not self.pipeline.empty and not self.closed:
+        sent = 0
+        while not self.pipeline.empty and not self.closed:
             try:
-                data = self.pipeline.read(BUFSIZ)
+                span = self._sendfile and self.pipeline.front_file()
+                if not span:
+                    data = self.pipeline.read_buffers(BUFSIZ,
+                            files=not self._sendfile)
             except pipeline.PipelineCloseRequest:
                 self.shutdown()
-            else:
-                try:
-                    bsent = self.sock.send(data)
-                except socket.error, e:
-                    code, s = e
-                    if code in (errno.EAGAIN, errno.EINTR):
-                        self.pipeline.backup(data)
-                        return
-                    self.shutdown(True)
-                except (SSL.WantReadError, SSL.WantWriteError, SSL.WantX509LookupError):
-                    self.pipeline.backup(data)
+                return
+            if not span and not data:
+                continue
+            try:
+                if span:
+                    fd, offset, length = span
+                    want = min(length, self.hub.io_budget)
+                    bsent = sendfile(self.sock.fileno(), fd, offset, want)
+                    if not bsent:
+                        # the file is shorter than it was when queued
+                        self.pipeline.file_ended()
+                        continue
+                else:
+                    want = sum(map(len, data))
+                    bsent = self._send(data)
+            except OSError, e:
+                # from sendfile()
+                if e.errno in (errno.EAGAIN, errno.EINTR):
                     return
-                except SSL.ZeroReturnError:
-                    self.shutdown(True)
-                except SSL.SysCallError:
-                    self.shutdown(True)
-                except:
-                    sys.stderr.write("Unknown Error on send():\n%s"
-                    % traceback.format_exc())
-                    self.shutdown(True)
+                self.shutdown(True)
+                return
+            except socket.error, e:
+                code, s = e
+                if code in (errno.EAGAIN, errno.EINTR):
+                    return
+                self.shutdown(True)
+                return
+            except (SSL.WantReadError, SSL.WantWriteError, SSL.WantX509LookupError):
+                return
+            except SSL.ZeroReturnError:
+                self.shutdown(True)
+                return
+            except SSL.SysCallError:
+                self.shutdown(True)
+                return
+            except:
+                sys.stderr.write("Unknown Error on send():\n%s"
+                % traceback.format_exc())
+                self.shutdown(True)
+                return
 
-                else:
-                    if bsent != len(data):
-                        self.pipeline.backup(data[bsent:])
+            self.pipeline.consume(bsent)
+            if self.write_waiter and self._written_down():
+                self.write_waiter()
+            if bsent != want:
+                # the socket buffer is full; wait to be told it isn't
+                return
+            sent += bsent
+            if not self.drain:
+                break
+            if sent >= self.hub.io_budget and not self.pipeline.empty:
+                # let other connections have a turn
+                self.hub.schedule(self.handle_write, True)
+                return
 
-                    if not self.pipeline.empty:
-                        return
-                    else:
-                        self.set_writable(False)
+        if self.pipeline.empty:
+            self.set_writable(False)
 
-    def handle_read(self):
-        '''The low-level handler called by the event hub
-        when the socket is ready for reading.
+    def _written_down(self):
+        '''Has the pipeline been written down to `write_mark` bytes (or
+        to nothing, if it's None)?
+        '''
+        if self.write_mark is None:
+            return self.pipeline.empty
+        return self.pipeline.size <= self.write_mark
+
+    def _send(self, data):
+        '''Write the list of strings `data` to the socket.
+
+        Returns the number of bytes sent; anything past that stays in
+        the pipeline for next time.
+        '''
+        if len(data) == 1:
+            return self.sock.send(data[0])
+        if self._sendmsg:
+            return self._sendmsg(data)
+        return self.sock.send(''.join(data))
+
+    def _recv(self):
+        '''Read a chunk from the socket.
+
+        Returns '' if the connection is gone, and None if there is
+        nothing to read right now.
         '''
-        if self.closed:
-            return
         try:
-            data = self.sock.recv(BUFSIZ)
+            return self.sock.recv(BUFSIZ)
         except socket.error, e:
             code, s = e
             if code in (errno.EAGAIN, errno.EINTR):
-                return
-            data = ''
+                return None
+            return ''
         except (SSL.WantReadError, SSL.WantWriteError, SSL.WantX509LookupError):
-            return
+            return None
         except SSL.ZeroReturnError:
-            data = ''
+            return ''
         except SSL.SysCallError:
-            data = ''
+            return ''
         except:
             sys.stderr.write("Unknown Error on recv():\n%s"
             % traceback.format_exc())
-            data = ''
+            return ''
 
-        if not data:
-            self.shutdown(True)
-        else:
-            res = self.buffer.feed(data)
+    def handle_read(self):
+        '''The low-level handler called by the event hub
+        when the socket is ready for reading.
+        '''
+        received = 0
+        while not self.closed and not self._reads_paused:
+            data = self._recv()
+            if data is None:
+                return
+            if not data:
+                self.shutdown(True)
+                return
+            try:
+                res = self.buffer.feed(data)
+            except buffer.BufferLimitExceeded, e:
+                res = e
             # Require a result that satisfies current term
             if res:
                 self.waiting_callback(res)
+            if (self.input_limit is not None and not self.waiting_callback
+                    and self.buffer.size >= self.input_limit):
+                # the loop isn't keeping up; leave the rest in the kernel
+                self._pause_reads()
+                return
+            if not self.drain:
+                return
+            received += len(data)
+            if received >= self.hub.io_budget:
+                # more may be waiting, but no new edge will say so
+                self.hub.schedule(self.handle_read, True)
+                return
 
     def handle_error(self):
         self.shutdown(True)
@@ -674,6 +1097,8 @@ class Datagram(str):
         return inst
 
 class UDPSocket(Connection):
+    __slots__ = ('port', 'parent', 'outgoing', 'incoming')
+
     def __init__(self, parent, sock, ip=None, port=None):
         self.port = port
         self.parent = parent
@@ -687,7 +1112,7 @@ class UDPSocket(Connection):
         dgram = Datagram(msg, self.parent.remote_addr)
         self.outgoing.append(dgram)
 
-    def check_incoming(self, condition, callback):
+    def check_incoming(self, condition, callback, max_length=None):
         assert condition is datagram, "UDP supports datagram sentinels only"
         if self.incoming:
             value = self.incoming.popleft()
@@ -732,33 +1157,40 @@ class UDPSocket(Connection):
         '''The low-level handler called by the event hub
         when the socket is ready for reading.
         '''
-        if self.closed:
-            return
-        try:
-            data, addr = self.sock.recvfrom(BUFSIZ)
-            dgram = Datagram(data, addr)
-        except socket.error, e:
-            code, s = e
-            if code in (errno.EAGAIN, errno.EINTR):
+        received = 0
+        while not self.closed:
+            try:
+                data, addr = self.sock.recvfrom(BUFSIZ)
+                dgram = Datagram(data, addr)
+            except socket.error, e:
+                code, s = e
+                if code in (errno.EAGAIN, errno.EINTR):
+                    return
+                dgram = Datagram('', (None, None))
+            except (SSL.WantReadError, SSL.WantWriteError, SSL.WantX509LookupError):
                 return
-            dgram = Datagram('', (None, None))
-        except (SSL.WantReadError, SSL.WantWriteError, SSL.WantX509LookupError):
-            return
-        except SSL.ZeroReturnError:
-            dgram = Datagram('', (None, None))
-        except SSL.SysCallError:
-            dgram = Datagram('', (None, None))
-        except:
-            sys.stderr.write("Unknown Error on recv():\n%s"
-            % traceback.format_exc())
-            dgram = Datagram('', (None, None))
+            except SSL.ZeroReturnError:
+                dgram = Datagram('', (None, None))
+            except SSL.SysCallError:
+                dgram = Datagram('', (None, None))
+            except:
+                sys.stderr.write("Unknown Error on recv():\n%s"
+                % traceback.format_exc())
+                dgram = Datagram('', (None, None))
 
-        if not dgram:
-            self.shutdown(True)
-        elif self.waiting_callback:
-            self.waiting_callback(dgram)
-        else:
-            self.incoming.append(dgram)
+            if not dgram:
+                self.shutdown(True)
+                return
+            elif self.waiting_callback:
+                self.waiting_callback(dgram)
+            else:
+                self.incoming.append(dgram)
+            if not self.drain:
+                return
+            received += len(dgram)
+            if received >= self.hub.io_budget:
+                self.hub.schedule(self.handle_read, True)
+                return
 
     def cleanup(self):
         self.waiting_callback = None
@@ -1,18 +1,25 @@
-from collections import defaultdict
-
 class StopWaitDispatch(Exception): pass
 class StaticValue(object):
+    __slots__ = ('value',)
+
     def __init__(self, value):
         self.value = value
 
 class EarlyValue(object):
+    __slots__ = ('val',)
+
     def __init__(self, val):
         self.val = val
 
 class Waiter(object):
     @property
     def wait_id(self):
-        return str(hash(self))
+        # computed once per waiter and kept on the instance
+        try:
+            return self._wait_id
+        except AttributeError:
+            wid = self._wait_id = str(hash(self))
+            return wid
 
     def process_fire(self, given):
         return StaticValue(given)
@@ -29,28 +36,48 @@ class StringWaiter(str, Waiter):
 class WaitPool(object):
     '''A structure that manages all `wait`ers, makes sure fired events
     get to the right places.
+
+    Only ids that somebody is waiting on are kept: firing an id with
+    no waiters stores nothing, and the set for an id is dropped once
+    its last waiter is cleared.
     '''
     def __init__(self):
-        self.waits = defaultdict(set)
-        self.loop_refs = defaultdict(set)
+        self.waits = {}
+        self.loop_refs = {}
 
     def wait(self, who, what):
         if isinstance(what, basestring):
-            what = StringWaiter(what)
-
-        if what.ready_early():
-            return EarlyValue(what.process_fire(None))
+            wait_id = intern(what) if type(what) is str else what
+        else:
+            if what.ready_early():
+                return EarlyValue(what.process_fire(None))
+            wait_id = what.wait_id
 
-        self.waits[what.wait_id].add(who)
-        self.loop_refs[who].add(what)
-        return what.wait_id
+        waiting = self.waits.get(wait_id)
+        if waiting is None:
+            waiting = self.waits[wait_id] = set()
+        waiting.add(who)
+        refs = self.loop_refs.get(who)
+        if refs is None:
+            refs = self.loop_refs[who] = set()
+        refs.add(wait_id)
+        return wait_id
 
     def fire(self, what, value):
         if isinstance(what, basestring):
-            what = StringWaiter(what)
+            waiting = self.waits.get(what)
+            if waiting:
+                for handler in waiting:
+                    if not handler.fire_due:
+                        handler.fire_in(what, value)
+            return
 
+        wait_id = what.wait_id
+        waiting = self.waits.get(wait_id)
+        if not waiting:
+            return
         static = False
-        for handler in self.waits[what.wait_id]:
+        for handler in waiting:
             if handler.fire_due:
                 continue
             if not static:
@@ -61,9 +88,16 @@ class WaitPool(object):
                 if type(value) == StaticValue:
                     static = True
                     value = value.value
-            handler.fire_in(what.wait_id, value)
+            handler.fire_in(wait_id, value)
 
     def clear(self, who):
-        for what in self.loop_refs[who]:
-            self.waits[what.wait_id].remove(who)
-        del self.loop_refs[who]
+        refs = self.loop_refs.pop(who, None)
+        if not refs:
+            return
+        waits = self.waits
+        for wait_id in refs:
+            waiting = waits.get(wait_id)
+            if waiting is not None:
+                waiting.discard(who)
+                if not waiting:
+                    del waits[wait_id]
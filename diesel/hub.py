@@ -16,23 +16,37 @@ else:
 
 import errno
 import fcntl
+import heapq
+import itertools
+import math
 import os
+import struct
 import thread
 
 from collections import deque
-from operator import attrgetter
+from Queue import Queue
 from time import time
-from Queue import Queue, Empty
 
-TRIGGER_COMPARE = attrgetter('trigger_time')
+from diesel.syscall import monotonic, eventfd
+
+# Not exposed by select until Python 2.7/3.x on some builds
+EPOLLET = getattr(select, 'EPOLLET', 1 << 31)
 
 class Timer(object):
     '''A timer is a promise to call some function at a future date.
     '''
+    __slots__ = ('hub', 'trigger_time', 'f', 'args', 'kw', 'pending', 'inq',
+            'hub_data')
+
     ALLOWANCE = 0.03 # If we're within 30ms, the timer is due
     def __init__(self, hub, interval, f, *args, **kw):
         self.hub = hub
-        self.trigger_time = time() + interval
+        # A loop can run for a while before it sets a timer, so the hub's
+        # cached `now` may be stale, and a timer based on it would come
+        # back early.  time() is far cheaper than the monotonic clock;
+        # the offset taken at the hub's last clock read turns it into
+        # monotonic time.
+        self.trigger_time = time() + hub._wall_offset + interval
         self.f = f
         self.args = args
         self.kw = kw
@@ -64,7 +78,170 @@ class Timer(object):
         The allowance provides some give-and-take so that if a
         sleep() delay comes back a little early, we still go.
         '''
-        return (self.trigger_time - time()) < self.ALLOWANCE
+        return (self.trigger_time - self.hub.now) < self.ALLOWANCE
+
+class CoarseTimer(Timer):
+    '''A timer kept on the hub's TimingWheel rather than the
+    precise timer heap.
+    '''
+    __slots__ = ()
+
+    def cancel(self):
+        self.pending = False
+        if self.inq:
+            self.inq = False
+            self.hub.coarse_timers.remove(self)
+            self.hub = None
+
+class TimingWheel(object):
+    '''A hashed timing wheel for coarse-grained timers.
+
+    Time is divided into ticks of `resolution` seconds, and each timer
+    lands in the slot for the tick it's due on (modulo the number of
+    slots).  Insert and cancel are O(1); advancing only visits the slots
+    for the ticks that have passed.  Timers fire up to one tick late,
+    never early.
+    '''
+    def __init__(self, resolution=0.1, slots=512):
+        self.resolution = resolution
+        self.slots = [set() for x in xrange(slots)]
+        self.current = int(monotonic() / resolution)
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def __nonzero__(self):
+        return self.count > 0
+
+    def add(self, t):
+        due = int(math.ceil(t.trigger_time / self.resolution))
+        if due <= self.current:
+            due = self.current + 1
+        t.hub_data = due
+        self.slots[due % len(self.slots)].add(t)
+        self.count += 1
+
+    def remove(self, t):
+        slot = self.slots[t.hub_data % len(self.slots)]
+        if t in slot:
+            slot.remove(t)
+            self.count -= 1
+
+    def time_to_next_tick(self, now):
+        return (self.current + 1) * self.resolution - now
+
+    def advance(self, now):
+        '''Move the wheel up to `now`, returning the timers that are due.
+        '''
+        target = int(now / self.resolution)
+        due = []
+        if target <= self.current:
+            return due
+        nslots = len(self.slots)
+        # After a long stall, one trip around the wheel covers every slot
+        first = max(self.current + 1, target - nslots + 1)
+        for tick in xrange(first, target + 1):
+            slot = self.slots[tick % nslots]
+            if slot:
+                fired = [t for t in slot if t.hub_data <= target]
+                for t in fired:
+                    slot.remove(t)
+                due.extend(fired)
+        self.current = target
+        self.count -= len(due)
+        return due
+
+class WorkerPool(object):
+    '''A bounded pool of OS threads that runs blocking calls on
+    behalf of diesel.thread().
+
+    Threads are started on demand, up to `size`, and then reused.  At
+    most `max_queued` jobs wait for a free thread; beyond that, jobs
+    are held back on the hub (their calling loops stay suspended)
+    until earlier jobs finish.
+    '''
+    def __init__(self, hub, size, max_queued=None):
+        self.hub = hub
+        self.size = size
+        self.max_queued = max_queued
+        self.jobs = Queue()
+        self.backlog = deque()
+        self.lock = thread.allocate_lock()
+        self.threads = 0
+        self.idle = 0
+        self.queued = 0
+        self.active = 0
+        self.completed = 0
+        self.wait_time = 0.0
+        self.max_wait = 0.0
+
+    def submit(self, reschedule, f, args, kw):
+        job = (reschedule, f, args, kw, monotonic())
+        if self.max_queued is not None and self.queued >= self.max_queued:
+            self.backlog.append(job)
+        else:
+            self._enqueue(job)
+
+    def _enqueue(self, job):
+        with self.lock:
+            self.queued += 1
+            spawn = self.idle < self.queued and self.threads < self.size
+            if spawn:
+                self.threads += 1
+        self.jobs.put(job)
+        if spawn:
+            thread.start_new_thread(self._work, ())
+
+    def _work(self):
+        while True:
+            with self.lock:
+                self.idle += 1
+            reschedule, f, args, kw, queued_at = self.jobs.get()
+            waited = monotonic() - queued_at
+            with self.lock:
+                self.idle -= 1
+                self.queued -= 1
+                self.active += 1
+                self.wait_time += waited
+                self.max_wait = max(self.max_wait, waited)
+            try:
+                res = f(*args, **kw)
+            except Exception, e:
+                res = e
+            self.hub.schedule_from_other_thread(self._done, (reschedule, res))
+
+    def _done(self, result):
+        '''Runs on the hub once a job is finished.
+        '''
+        reschedule, res = result
+        with self.lock:
+            self.active -= 1
+            self.completed += 1
+        if self.backlog:
+            self._enqueue(self.backlog.popleft())
+        reschedule(res)
+
+    def stats(self):
+        '''A snapshot of the pool's activity.
+
+        `wait_time` is the total time jobs spent queued for a thread;
+        `backlog` counts jobs held on the hub by the queue limit.
+        '''
+        with self.lock:
+            return dict(
+                size=self.size,
+                threads=self.threads,
+                idle=self.idle,
+                queued=self.queued,
+                backlog=len(self.backlog),
+                active=self.active,
+                completed=self.completed,
+                wait_time=self.wait_time,
+                max_wait=self.max_wait,
+                avg_wait=(self.wait_time / self.completed
+                          if self.completed else 0.0),
+            )
 
 class _PipeWrap(object):
     def __init__(self, p):
@@ -75,64 +252,192 @@ class _PipeWrap(object):
 
 class IntWrap(_PipeWrap): pass
 
-class AbstractEventHub(object):
+class TimerHeap(object):
+    '''A binary heap of pending timers, ordered by trigger time.
+
+    Cancelled timers are not searched for and removed; they are just
+    counted, and skipped when they reach the top of the heap.  When
+    more than half of the heap is dead weight, it is rebuilt.
+    '''
+    COMPACT_MIN = 1024
+
     def __init__(self):
-        self.timers = []
+        self.heap = []
+        self.cancelled = 0
+        self._seq = itertools.count()
+
+    def __len__(self):
+        return len(self.heap) - self.cancelled
+
+    def __nonzero__(self):
+        return len(self.heap) > self.cancelled
+
+    def push(self, t):
+        # The sequence number breaks ties between equal trigger times,
+        # so Timers themselves never get compared.
+        heapq.heappush(self.heap, (t.trigger_time, self._seq.next(), t))
+
+    def discard(self, t):
+        '''Note that `t`, which is in the heap, has been cancelled.
+        '''
+        self.cancelled += 1
+        if (self.cancelled > self.COMPACT_MIN and
+            self.cancelled * 2 > len(self.heap)):
+            self.compact()
+
+    def compact(self):
+        self.heap = [e for e in self.heap if e[2].pending]
+        heapq.heapify(self.heap)
+        self.cancelled = 0
+
+    def _skip_cancelled(self):
+        heap = self.heap
+        while heap and not heap[0][2].pending:
+            heapq.heappop(heap)
+            self.cancelled -= 1
+
+    def peek(self):
+        '''Return the next pending timer, or None.
+        '''
+        self._skip_cancelled()
+        return self.heap[0][2] if self.heap else None
+
+    def pop(self):
+        self._skip_cancelled()
+        return heapq.heappop(self.heap)[2]
+
+YES_ENV = ['1', 'on', 'true', 'yes']
+
+class AbstractEventHub(object):
+    COARSE_RESOLUTION = 0.1
+    IO_BUDGET = 2 ** 18
+    THREAD_POOL_SIZE = 32
+    THREAD_QUEUE_LIMIT = 256
+
+    # Hubs that can deliver edge-triggered readiness set this; connections
+    # registered with edge=True must then drain their sockets until EAGAIN.
+    edge_triggered = False
+
+    def __init__(self, coarse_resolution=None):
+        self.update_now()
+        # When the hub last got control back between loops, and whether
+        # it is blocked waiting for events (see diesel.util.watchdog).
+        # Only handle_events beats, so a loop that reads the clock
+        # doesn't look alive.
+        self.heartbeat = self.now
+        self.polling = False
+        # a diesel.util.stats.HubMetrics, when switched on
+        self.metrics = None
+        self.timers = TimerHeap()
+        self.coarse_timers = TimingWheel(
+                coarse_resolution or self.COARSE_RESOLUTION)
         self.new_timers = []
         self.run = True
         self.events = {}
         self.run_now = deque()
+        self.fired = deque()
         self.fdmap = {}
         self._setup_threading()
         self.reschedule = deque()
+        self.io_budget = self.IO_BUDGET
+        self.thread_pool = WorkerPool(
+                self, self.THREAD_POOL_SIZE, self.THREAD_QUEUE_LIMIT)
 
     def _setup_threading(self):
-        self._t_recv, self._t_wakeup = os.pipe()
-        fcntl.fcntl(self._t_recv, fcntl.F_SETFL, os.O_NONBLOCK)
-        fcntl.fcntl(self._t_wakeup, fcntl.F_SETFL, os.O_NONBLOCK)
-        self.thread_comp_in = Queue()
+        # Completions from other threads; deque appends and pops are
+        # atomic, so no lock is needed
+        self.thread_comp_in = deque()
+        self._wake_pending = False
+        self._t_recv = None
+        if eventfd:
+            try:
+                self._t_recv = self._t_wakeup = eventfd()
+                self._wake_token = struct.pack('=Q', 1)
+            except OSError:
+                pass
+        if self._t_recv is None:
+            self._t_recv, self._t_wakeup = os.pipe()
+            fcntl.fcntl(self._t_recv, fcntl.F_SETFL, os.O_NONBLOCK)
+            fcntl.fcntl(self._t_wakeup, fcntl.F_SETFL, os.O_NONBLOCK)
+            self._wake_token = '\0'
 
         def handle_thread_done():
+            # Consume the signal, then clear the flag, then drain.  A
+            # completion queued before the flag is cleared is drained
+            # below; one queued after it signals again.  Clearing first
+            # would let the read swallow a fresh signal and leave the
+            # flag set with nothing pending.
             try:
                 os.read(self._t_recv, 65536)
-            except IOError:
+            except (IOError, OSError):
                 pass
-            while True:
-                try:
-                    c, v = self.thread_comp_in.get(False)
-                except Empty:
-                    break
-                else:
+            self._wake_pending = False
+            comp = self.thread_comp_in
+            try:
+                while comp:
+                    c, v = comp.popleft()
                     c(v)
+            finally:
+                if comp:
+                    self.wake_from_other_thread()
         self.register(_PipeWrap(self._t_recv), handle_thread_done, None, None)
 
+    def close(self):
+        '''Close the hub's own descriptors.  The hub can't be used
+        afterwards.
+        '''
+        os.close(self._t_recv)
+        if self._t_wakeup != self._t_recv:
+            os.close(self._t_wakeup)
+
     def remove_timer(self, t):
-        try:
-            self.timers.remove(t)
-        except IndexError:
-            pass
+        self.timers.discard(t)
 
     def run_in_thread(self, reschedule, f, *args, **kw):
-        def wrap():
-            try:
-                res = f(*args, **kw)
-            except Exception, e:
-                self.thread_comp_in.put((reschedule, e))
-            else:
-                self.thread_comp_in.put((reschedule, res))
-            self.wake_from_other_thread()
-        thread.start_new_thread(wrap, ())
+        '''Run f(*args, **kw) on the hub's worker thread pool, and pass
+        the result (or exception) to `reschedule` back on the hub.
+        '''
+        self.thread_pool.submit(reschedule, f, args, kw)
 
     def wake_from_other_thread(self):
-        try:
-            os.write(self._t_wakeup, '\0')
-        except IOError:
-            pass
+        '''Make the hub's poll return.
 
-    def schedule_loop_from_other_thread(self, l, v=None):
-        self.thread_comp_in.put((l.wake, v))
+        Only the first wakeup since the hub last drained completions
+        actually signals the eventfd (or pipe).
+        '''
+        if not self._wake_pending:
+            self._wake_pending = True
+            try:
+                os.write(self._t_wakeup, self._wake_token)
+            except (IOError, OSError):
+                pass
+
+    def schedule_from_other_thread(self, c, v):
+        '''Have the hub call c(v) soon; safe to call from any thread.
+        '''
+        self.thread_comp_in.append((c, v))
         self.wake_from_other_thread()
 
+    def schedule_loop_from_other_thread(self, l, v=None):
+        self.schedule_from_other_thread(l.wake, v)
+
+    def update_now(self):
+        '''Refresh the hub's cached clock.
+
+        `now` is read from a monotonic clock once per pass through the
+        hub (and again after blocking in poll), and is what timers are
+        scheduled and checked against.  Loops that need a timestamp
+        cheaply can use it too, as long as being off by the duration
+        of one pass is acceptable.
+
+        It also records how far the wall clock is from the monotonic one,
+        so that Timer can read the cheaper wall clock.  A wall clock jump
+        skews only the timers created before the next read.
+        '''
+        self.now = monotonic()
+        self._wall_offset = self.now - time()
+        return self.now
+
     def handle_events(self):
         '''Run one pass of event handling.
         '''
@@ -145,27 +450,83 @@ class AbstractEventHub(object):
         self.new_timers.append(t)
         return t
 
+    def call_later_coarse(self, interval, f, *args, **kw):
+        '''Schedule a coarse timer on the hub.
+
+        Coarse timers are cheap to create and cancel, but only fire at
+        the resolution of the hub's TimingWheel (100ms by default).  Good
+        for timeouts that usually get cancelled before they go off.
+        '''
+        t = CoarseTimer(self, interval, f, *args, **kw)
+        t.inq = True
+        self.coarse_timers.add(t)
+        self._coarse_timer_added()
+        return t
+
+    def _coarse_timer_added(self):
+        pass
+
+    def _run_coarse_timers(self, now):
+        '''Fire any coarse timers that are due; returns False if the
+        hub was stopped by one of them.
+        '''
+        for t in self.coarse_timers.advance(now):
+            if t.pending:
+                t.callback()
+                while self.run_now and self.run:
+                    self.run_now.popleft()()
+                if not self.run:
+                    return False
+        return True
+
     def schedule(self, c, reschedule=False):
         if reschedule:
             self.reschedule.append(c)
         else:
             self.run_now.append(c)
 
-    def register(self, fd, read_callback, write_callback, error_callback):
+    def schedule_fire(self, c, value):
+        '''Have the hub call c(value) soon, for a loop woken by fire().
+
+        Fired wakes are queued as plain (callback, value) pairs and the
+        whole batch is run by one entry on the run queue, so waking
+        thousands of waiters costs no closure or run queue slot apiece.
+
+        Waiters still wake in the order they were fired, but the batch
+        runs where its first wake was queued: anything scheduled between
+        two fire()s now runs after the waiters of both.
+        '''
+        if not self.fired:
+            self.run_now.append(self._run_fired)
+        self.fired.append((c, value))
+
+    def _run_fired(self):
+        # wakes fired while this batch runs go in the next one
+        fired = self.fired
+        self.fired = deque()
+        for c, value in fired:
+            c(value)
+
+    def register(self, fd, read_callback, write_callback, error_callback,
+            edge=False):
         '''Register a socket fd with the hub, providing callbacks
         for read (data is ready to be recv'd) and write (buffers are
         ready for send()).
 
         By default, only the read behavior will be polled and the
         read callback used until enable_write is invoked.
+
+        If `edge` is true and the hub is running edge-triggered, the
+        fd is only reported when it becomes ready, so the callbacks
+        must read and write until EAGAIN (or reschedule themselves).
         '''
         fn = fd.fileno()
         self.fdmap[fd] = fn
         assert fn not in self.events
         self.events[fn] = (read_callback, write_callback, error_callback)
-        self._add_fd(fd)
+        self._add_fd(fd, edge and self.edge_triggered)
 
-    def _add_fd(self, fd):
+    def _add_fd(self, fd, edge=False):
         '''Add this socket to the list of sockets used in the
         poll call.
         '''
@@ -181,6 +542,17 @@ class AbstractEventHub(object):
         '''
         raise NotImplementedError
 
+    def enable_read(self, fd):
+        '''Resume read polling after disable_read().
+        '''
+        raise NotImplementedError
+
+    def disable_read(self, fd):
+        '''Stop polling for reads (and calling the read callback)
+        until enable_read() is invoked.
+        '''
+        raise NotImplementedError
+
     def unregister(self, fd):
         '''Remove this socket from the list of sockets the
         hub is polling on.
@@ -203,15 +575,33 @@ class AbstractEventHub(object):
 
 class EPollEventHub(AbstractEventHub):
     '''A epoll-based hub.
+
+    Edge-triggered mode for connections is opt-in, either with
+    `edge_triggered=True` or by setting DIESEL_EDGE_TRIGGERED in
+    the environment.
     '''
-    def __init__(self):
+    def __init__(self, coarse_resolution=None, edge_triggered=None):
         self.epoll = select.epoll()
-        super(EPollEventHub, self).__init__()
+        if edge_triggered is None:
+            edge_triggered = (os.environ.get('DIESEL_EDGE_TRIGGERED', '')
+                                .lower() in YES_ENV)
+        self.edge_triggered = edge_triggered
+        self._edge_fds = set()
+        self._write_fds = set()
+        self._unread_fds = set()
+        # fds that hung up while their reads were paused, taken out of
+        # the epoll set until someone wants to read or write them again
+        self._hup_fds = set()
+        super(EPollEventHub, self).__init__(coarse_resolution)
 
     @property
     def describe(self):
         return "hand-rolled select.epoll"
 
+    def close(self):
+        super(EPollEventHub, self).close()
+        self.epoll.close()
+
     def handle_events(self):
         '''Run one pass of event handling.
 
@@ -219,6 +609,12 @@ class EPollEventHub(AbstractEventHub):
         timer.  When epoll returns, all fd-related events (if any) are
         handled, and timers are handled as well.
         '''
+        metrics = self.metrics
+        if metrics is not None:
+            started = monotonic()
+            polled = 0
+            metrics.run_queue.record(len(self.run_now))
+
         while self.run_now and self.run:
             self.run_now.popleft()()
 
@@ -226,34 +622,62 @@ class EPollEventHub(AbstractEventHub):
             for tr in self.new_timers:
                 if tr.pending:
                     tr.inq = True
-                    self.timers.append(tr)
-            self.timers.sort(key=TRIGGER_COMPARE, reverse=True)
+                    self.timers.push(tr)
             self.new_timers = []
 
-        tm = time()
-        timeout = (self.timers[-1].trigger_time - tm) if self.timers else 1e6
+        tm = self.heartbeat = self.update_now()
+        nt = self.timers.peek()
+        timeout = (nt.trigger_time - tm) if nt else 1e6
+        if self.coarse_timers:
+            timeout = min(timeout, self.coarse_timers.time_to_next_tick(tm))
         # epoll, etc, limit to 2^^31/1000 or OverflowError
         timeout = min(timeout, 1e6)
         if timeout < 0 or self.reschedule:
             timeout = 0
 
         # Run timers first, to try to nail their timings
-        while self.timers and self.timers[-1].due:
+        while self.timers and self.timers.peek().due:
             t = self.timers.pop()
             if t.pending:
+                if metrics is not None:
+                    metrics.timer_lateness.record(
+                            max(monotonic() - t.trigger_time, 0))
                 t.callback()
                 while self.run_now and self.run:
                     self.run_now.popleft()()
                 if not self.run:
                     return
 
+        if self.coarse_timers and not self._run_coarse_timers(tm):
+            return
+
         # Handle all socket I/O
         try:
-            for (fd, evtype) in self.epoll.poll(timeout):
+            if metrics is not None:
+                polled = monotonic()
+            self.polling = True
+            try:
+                events = self.epoll.poll(timeout)
+            finally:
+                self.heartbeat = self.update_now()
+                self.polling = False
+                # here, so a poll interrupted by a signal counts too
+                if metrics is not None:
+                    polled = self.now - polled
+                    metrics.poll_time.record(polled)
+            if metrics is not None:
+                metrics.poll_events.record(len(events))
+            for (fd, evtype) in events:
                 if evtype & select.EPOLLIN or evtype & select.EPOLLPRI:
                     self.events[fd][0]()
                 elif evtype & select.EPOLLERR or evtype & select.EPOLLHUP:
-                    self.events[fd][2]()
+                    if fd in self._unread_fds and fd not in self._write_fds:
+                        # what the peer sent is still waiting to be read;
+                        # report the hangup once reads resume
+                        self._hup_fds.add(fd)
+                        self.epoll.unregister(fd)
+                    else:
+                        self.events[fd][2]()
                 # fd could be removed by above read
                 if evtype & select.EPOLLOUT and fd in self.events:
                     self.events[fd][1]()
@@ -271,36 +695,88 @@ class EPollEventHub(AbstractEventHub):
 
         self.run_now = self.reschedule
         self.reschedule = deque()
+        if metrics is not None:
+            metrics.busy_time.record(monotonic() - started - polled)
 
-    def _add_fd(self, fd):
+    def _add_fd(self, fd, edge=False):
         '''Add this socket to the list of sockets used in the
         poll call.
         '''
-        self.epoll.register(fd, select.EPOLLIN | select.EPOLLPRI)
+        mask = select.EPOLLIN | select.EPOLLPRI
+        if edge:
+            self._edge_fds.add(fd.fileno())
+            mask |= EPOLLET
+        self.epoll.register(fd, mask)
+
+    def _mask(self, fd):
+        fn = fd.fileno()
+        if fn in self._unread_fds:
+            mask = 0
+        else:
+            mask = select.EPOLLIN | select.EPOLLPRI
+        if fn in self._write_fds:
+            mask |= select.EPOLLOUT
+        if fn in self._edge_fds:
+            mask |= EPOLLET
+        return mask
 
     def enable_write(self, fd):
         '''Enable write polling and the write callback.
         '''
-        self.epoll.modify(
-                fd, select.EPOLLIN | select.EPOLLPRI | select.EPOLLOUT)
+        self._write_fds.add(fd.fileno())
+        # For edge-triggered fds, modify() also re-arms the fd, so a
+        # socket that is already writable is reported again.
+        self._rearm(fd)
 
     def disable_write(self, fd):
         '''Disable write polling and the write callback.
         '''
-        self.epoll.modify(fd, select.EPOLLIN | select.EPOLLPRI)
+        self._write_fds.discard(fd.fileno())
+        self._rearm(fd)
+
+    def enable_read(self, fd):
+        '''Resume read polling after disable_read().
+        '''
+        self._unread_fds.discard(fd.fileno())
+        # as with writes, this re-arms an edge-triggered fd
+        self._rearm(fd)
+
+    def disable_read(self, fd):
+        '''Stop polling for reads (and calling the read callback)
+        until enable_read() is invoked.
+        '''
+        self._unread_fds.add(fd.fileno())
+        self._rearm(fd)
+
+    def _rearm(self, fd):
+        fn = fd.fileno()
+        if fn not in self._hup_fds:
+            self.epoll.modify(fd, self._mask(fd))
+        elif fn not in self._unread_fds or fn in self._write_fds:
+            # epoll reports the hangup (and any data left) again
+            self._hup_fds.discard(fn)
+            self.epoll.register(fd, self._mask(fd))
 
     def _remove_fd(self, fd):
         '''Remove this socket from the list of sockets the
         hub is polling on.
         '''
-        self.epoll.unregister(fd)
+        fn = fd.fileno()
+        self._edge_fds.discard(fn)
+        self._write_fds.discard(fn)
+        self._unread_fds.discard(fn)
+        if fn in self._hup_fds:
+            self._hup_fds.discard(fn)
+        else:
+            self.epoll.unregister(fd)
 
 class LibEvHub(AbstractEventHub):
-    def __init__(self):
+    def __init__(self, coarse_resolution=None):
         self._ev_loop = pyev.default_loop()
         self._ev_timers = {}
         self._ev_fdmap = {}
-        AbstractEventHub.__init__(self)
+        AbstractEventHub.__init__(self, coarse_resolution)
+        self._ev_wheel = None
 
     @property
     def describe(self):
@@ -317,9 +793,18 @@ class LibEvHub(AbstractEventHub):
     def handle_events(self):
         '''Run one pass of event handling.
         '''
+        metrics = self.metrics
+        if metrics is not None:
+            started = monotonic()
+            metrics.run_queue.record(len(self.run_now))
+
         while self.run_now and self.run:
             self.run_now.popleft()()
 
+        if metrics is not None:
+            # libev's callbacks only queue work, so this is all of it
+            metrics.busy_time.record(monotonic() - started)
+
         if not self.run:
             self._ev_loop.stop()
             del self._ev_loop
@@ -330,9 +815,21 @@ class LibEvHub(AbstractEventHub):
 
         if self.run_now:
             self._ev_loop.start(pyev.EVRUN_NOWAIT)
+            self.heartbeat = self.update_now()
         else:
-            while not self.run_now:
-                self._ev_loop.start(pyev.EVRUN_ONCE)
+            if metrics is not None:
+                polled = monotonic()
+            self.polling = True
+            try:
+                while not self.run_now:
+                    self._ev_loop.start(pyev.EVRUN_ONCE)
+            finally:
+                self.heartbeat = self.update_now()
+                self.polling = False
+                if metrics is not None:
+                    metrics.poll_time.record(self.now - polled)
+            if metrics is not None:
+                metrics.poll_events.record(len(self.run_now))
 
     def call_later(self, interval, f, *args, **kw):
         '''Schedule a timer on the hub.
@@ -349,6 +846,9 @@ class LibEvHub(AbstractEventHub):
         t = self._ev_timers.pop(watcher)
         if t.hub_data:
             t.hub_data = None
+            if self.metrics is not None:
+                self.metrics.timer_lateness.record(
+                        max(monotonic() - t.trigger_time, 0))
             self.run_now.append(t.callback)
 
     def remove_timer(self, t):
@@ -357,6 +857,21 @@ class LibEvHub(AbstractEventHub):
             del self._ev_timers[evt]
             evt.stop()
 
+    def _coarse_timer_added(self):
+        if self._ev_wheel is None:
+            res = self.coarse_timers.resolution
+            self._ev_wheel = self._ev_loop.timer(
+                    res, res, self._ev_wheel_ticked)
+            self._ev_wheel.start()
+
+    def _ev_wheel_ticked(self, watcher, revents):
+        for t in self.coarse_timers.advance(self.update_now()):
+            if t.pending:
+                self.run_now.append(t.callback)
+        if not self.coarse_timers:
+            self._ev_wheel.stop()
+            self._ev_wheel = None
+
     def schedule(self, c, reschedule=False):
         if reschedule:
             self.reschedule.append(c)
@@ -372,7 +887,7 @@ class LibEvHub(AbstractEventHub):
         if revents & pyev.EV_ERROR:
             self.run_now.append(e)
 
-    def _add_fd(self, fd):
+    def _add_fd(self, fd, edge=False):
         '''Add this socket to the list of sockets used in the
         poll call.
         '''
@@ -392,6 +907,17 @@ class LibEvHub(AbstractEventHub):
         '''
         self._ev_fdmap[fd][1].stop()
 
+    def enable_read(self, fd):
+        '''Resume read polling after disable_read().
+        '''
+        self._ev_fdmap[fd][0].start()
+
+    def disable_read(self, fd):
+        '''Stop polling for reads (and calling the read callback)
+        until enable_read() is invoked.
+        '''
+        self._ev_fdmap[fd][0].stop()
+
     def _remove_fd(self, fd):
         '''Remove this socket from the list of sockets the
         hub is polling on.
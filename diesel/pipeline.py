@@ -2,20 +2,10 @@
 '''An outgoing pipeline that can handle
 strings or files.
 '''
-try:
-    import cStringIO
-except ImportError:
-    raise ImportError, "cStringIO is required"
-
-from bisect import bisect_right
-
-_obj_SIO = cStringIO.StringIO
-_type_SIO = cStringIO.OutputType
-def make_SIO(d):
-    t = _obj_SIO()
-    t.write(d)
-    t.seek(0)
-    return t
+import os
+import stat
+from bisect import insort
+from collections import deque
 
 def get_file_length(f):
     m = f.tell()
@@ -24,53 +14,171 @@ def get_file_length(f):
     f.seek(m)
     return r
 
+def get_regular_fd(f):
+    '''Return the descriptor behind `f` if it's a regular file on
+    disk (and so can be handed to sendfile()), else None.
+    '''
+    try:
+        fd = f.fileno()
+        if stat.S_ISREG(os.fstat(fd).st_mode):
+            return fd
+    except (AttributeError, IOError, OSError, ValueError):
+        pass
+    return None
+
+class FileRange(object):
+    '''`length` bytes of the file `f`, starting at `offset`.
+
+    send() one of these to write part of a file.  By default the range
+    runs from the file's current position to its end, which is what
+    sending the file itself does.
+    '''
+    def __init__(self, f, offset=None, length=None):
+        self.f = f
+        self.offset = offset
+        self.length = length
+
 class PipelineCloseRequest(Exception): pass
 class PipelineClosed(Exception): pass
 
 class PipelineItem(object):
+    '''One entry in the pipeline: a run of strings, or a file.
+
+    Strings are kept as a list of chunks plus an offset into the first
+    one, so consuming part of the item never copies what is left.
+    Files are read lazily, a window at a time, into the same chunks;
+    `pos` is the file offset of the first byte not yet consumed.  When
+    a file is a regular one on disk, `fd` is set and the connection
+    may send it with sendfile() instead of reading it at all.
+
+    Small strings are glued onto a small last chunk as they arrive, so
+    a run of tiny writes doesn't become thousands of chunks to walk.
+    '''
+    __slots__ = ('chunks', 'offset', 'buffered', 'pos', 'fd', 'f', 'length',
+            'is_sio')
+
+    COALESCE = 4096
+
     def __init__(self, d):
+        self.chunks = deque()
+        self.offset = 0
+        self.buffered = 0
+        self.pos = 0
+        self.fd = None
         if type(d) is str:
-            self.f = make_SIO(d)
-            self.length = len(d)
+            self.f = None
+            self.chunks.append(d)
+            self.buffered = self.length = len(d)
             self.is_sio = True
-            self.f.seek(0, 2)
-        elif hasattr(d, 'seek'):
-            self.f = d
-            self.length = get_file_length(d)
+        elif type(d) is FileRange or hasattr(d, 'seek'):
+            if type(d) is FileRange:
+                f, pos, length = d.f, d.offset, d.length
+            else:
+                f, pos, length = d, None, None
+            if pos is None:
+                pos = f.tell()
+            if length is None:
+                length = get_file_length(f) - pos
+            self.f = f
+            self.pos = pos
+            self.length = length
+            self.fd = get_regular_fd(f)
             self.is_sio = False
         else:
             raise ValueError("argument to add() must be either a str or a file-like object")
-        self.read = self.f.read
 
     def merge(self, s):
-        self.f.write(s)
+        chunks = self.chunks
+        if len(s) < self.COALESCE and chunks and len(chunks[-1]) < self.COALESCE:
+            chunks[-1] += s
+        else:
+            chunks.append(s)
         self.length += len(s)
+        self.buffered += len(s)
 
     def reset(self):
-        if self.is_sio:
-            self.is_sio = False
-            self.f.seek(0, 0)
+        self.is_sio = False
 
-    @property
-    def done(self):
-        return self.f.tell() == self.length
+    def _fill(self, amt):
+        try:
+            self.f.seek(self.pos + self.buffered)
+            data = self.f.read(min(amt, self.length) - self.buffered)
+        except ValueError:
+            data = ''
+        if data:
+            self.chunks.append(data)
+            self.buffered += len(data)
+        else:
+            self.cut_short()
+
+    def cut_short(self):
+        '''The file came up short (or was closed); stop at what's
+        already been read.
+        '''
+        self.length = self.buffered
+
+    def buffers(self, amt, out):
+        '''Append up to `amt` bytes of pending data to the list `out`,
+        without consuming it.  Returns the number of bytes added.
+        '''
+        if self.f is not None and self.buffered < min(amt, self.length):
+            self._fill(amt)
+        got = 0
+        offset = self.offset
+        for c in self.chunks:
+            if got >= amt:
+                break
+            n = len(c) - offset
+            if offset or n > amt - got:
+                n = min(n, amt - got)
+                c = c[offset:offset + n]
+            out.append(c)
+            got += n
+            offset = 0
+        return got
 
-    def __cmp__(self, other):
-        if other is PipelineStandIn:
-            return -1
-        return cmp(self, other) 
+    def consume(self, n):
+        '''Drop the first `n` bytes of the item.
+        '''
+        self.length -= n
+        self.pos += n
+        if not self.buffered:
+            # it went out by sendfile()
+            return
+        self.buffered -= n
+        chunks = self.chunks
+        n += self.offset
+        while chunks and n >= len(chunks[0]):
+            n -= len(chunks.popleft())
+        self.offset = n
 
-class PipelineStandIn(object): pass
+    @property
+    def done(self):
+        return self.length == 0
 
 class Pipeline(object):
     '''A pipeline that supports appending strings or
     files and can read() transparently across object
     boundaries in the outgoing buffer.
+
+    Items wait in a deque per priority; `priorities` holds the
+    priorities that have anything queued, highest first (stored
+    negated, so it sorts that way).  Data put back with backup() goes
+    in `front`, ahead of everything else; it's only created then.
+
+    `size` counts the bytes of string data waiting to go out.  Files
+    aren't included, since they're read as they're sent.
     '''
+    __slots__ = ('queues', 'priorities', 'front', 'current', 'want_close',
+            'size')
+
     def __init__(self):
-        self.line = []
+        self.queues = {}
+        self.priorities = []
+        self.front = None
         self.current = None
         self.want_close = False
+        self.size = 0
 
     def add(self, d, priority=5):
         '''Add object `d` to the pipeline.
@@ -80,16 +188,17 @@ class Pipeline(object):
 
         priority *= -1
 
-        dummy = (priority, PipelineStandIn)
-        ind = bisect_right(self.line, dummy)
-        if ind > 0 and type(d) is str and self.line[ind - 1][-1].is_sio:
-            a_pri, adjacent = self.line[ind - 1]
-            if adjacent.is_sio and a_pri == priority:
-                adjacent.merge(d)
-            else:
-                self.line.insert(ind, (priority, PipelineItem(d)))
-        else:
-            self.line.insert(ind, (priority, PipelineItem(d)))
+        if type(d) is str:
+            self.size += len(d)
+        queue = self.queues.get(priority)
+        if queue and type(d) is str and queue[-1].is_sio:
+            queue[-1].merge(d)
+            return
+        item = PipelineItem(d)
+        if queue is None:
+            queue = self.queues[priority] = deque()
+            insort(self.priorities, priority)
+        queue.append(item)
 
     def close_request(self):
         '''Add a close request to the outgoing pipeline.
@@ -99,42 +208,113 @@ class Pipeline(object):
         '''
         self.want_close = True
 
+    def read_buffers(self, amt, files=True):
+        '''Return a list of strings holding up to `amt` bytes from the
+        front of the pipeline, without consuming them.
+
+        Once some of the data has been written, consume() the number
+        of bytes that went out.  With `files` False, a regular file
+        that isn't at the front is left for front_file() instead of
+        being read in behind what's ahead of it.
+
+        May raise PipelineCloseRequest if the pipeline is empty and
+        the connected stream should be closed.
+        '''
+        if self._front() is None:
+            return []
+
+        out = []
+        got = self.current.buffers(amt, out)
+        for item in self._waiting():
+            if got >= amt or (not files and item.fd is not None):
+                break
+            got += item.buffers(amt - got, out)
+        return out
+
+    def front_file(self):
+        '''If the next thing to go out is part of a regular file that
+        hasn't been read into memory, return (fd, offset, length) for
+        it so it can be written with sendfile(); otherwise None.
+
+        Send some of it, then consume() the number of bytes sent, or
+        call file_ended() if the file turned out shorter than expected.
+        May raise PipelineCloseRequest like read_buffers().
+        '''
+        cur = self._front()
+        if cur is not None and cur.fd is not None and not cur.buffered:
+            return cur.fd, cur.pos, cur.length
+        return None
+
+    def file_ended(self):
+        '''The file at the front of the pipeline has no more data.
+        '''
+        self.current.cut_short()
+        self.consume(0)
+
+    def _waiting(self):
+        if self.front:
+            for item in self.front:
+                yield item
+        for priority in self.priorities:
+            for item in self.queues[priority]:
+                yield item
+
+    def _front(self):
+        cur = self.current
+        while cur is None or cur.done:
+            if not self.front and not self.priorities:
+                self.current = None
+                if self.want_close:
+                    raise PipelineCloseRequest()
+                return None
+            cur = self._next_item()
+        return cur
+
+    def consume(self, n):
+        '''Drop `n` bytes, previously returned by read_buffers(), from
+        the front of the pipeline.
+        '''
+        cur = self.current
+        while n:
+            used = min(n, cur.length)
+            cur.consume(used)
+            if cur.f is None:
+                self.size -= used
+            n -= used
+            if n:
+                cur = self._next_item()
+
+        # eagerly evict anything that's been used up, so that we
+        # know when we're empty and don't bother with useless iterations;
+        # what goes next is left to _front(), so that anything added at
+        # a higher priority in the meantime still goes ahead of it
+        if cur and cur.done:
+            self.current = None
+
+    def _next_item(self):
+        if self.front:
+            self.current = self.front.popleft()
+        elif self.priorities:
+            priority = self.priorities[0]
+            queue = self.queues[priority]
+            self.current = queue.popleft()
+            if not queue:
+                del self.queues[priority]
+                self.priorities.pop(0)
+        else:
+            self.current = None
+            return None
+        self.current.reset()
+        return self.current
+
     def read(self, amt):
         '''Read up to `amt` bytes off the pipeline.
 
         May raise PipelineCloseRequest if the pipeline is
         empty and the connected stream should be closed.
         '''
-        if not self.current and not self.line:
-            if self.want_close:
-                raise PipelineCloseRequest()
-            return ''
-
-        if not self.current:
-            _, self.current = self.line.pop(0)
-            self.current.reset()
-
-        out = ''
-        while len(out) < amt:
-            try:
-                data = self.current.read(amt - len(out))
-            except ValueError:
-                data = ''
-            if data == '':
-                if not self.line:
-                    self.current = None
-                    break
-                _, self.current = self.line.pop(0)
-                self.current.reset()
-            else:
-                out += data
-
-        # eagerly evict and EOF that's been read _just_ short of 
-        # the EOF '' read() call.. so that we know we're empty,
-        # and we don't bother with useless iterations
-        if self.current and self.current.done:
-            self.current = None
-
+        out = ''.join(self.read_buffers(amt))
+        self.consume(len(out))
         return out
     
     def backup(self, d):
@@ -146,8 +326,12 @@ class Pipeline(object):
         cur = self.current
         self.current = PipelineItem(d)
         self.current.reset()
+        if self.current.f is None:
+            self.size += self.current.length
         if cur:
-            self.line.insert(0, (-1000000, cur))
+            if self.front is None:
+                self.front = deque()
+            self.front.appendleft(cur)
 
     @property
     def empty(self):
@@ -156,4 +340,5 @@ class Pipeline(object):
         A close request is "data" that needs to be consumed,
         too.
         '''
-        return self.want_close == False and not self.line and not self.current
+        return (self.want_close == False and not self.current
+                and not self.front and not self.priorities)
@@ -5,7 +5,6 @@
 import cStringIO
 import os
 import urllib
-import time
 from datetime import datetime
 from urlparse import urlparse
 from flask import Request, Response
@@ -19,6 +18,7 @@ except ImportError:
     from http_parser.pyparser import HttpParser
 
 from diesel import receive, ConnectionClosed, send, log, Client, call, first
+from diesel import runtime
 
 SERVER_TAG = 'diesel-http-server'
 
@@ -159,10 +159,10 @@ class HttpRequestTimeout(Exception): pass
 class TimeoutHandler(object):
     def __init__(self, timeout):
         self._timeout = timeout
-        self._start = time.time()
+        self._start = runtime.current_app.hub.now
 
     def remaining(self, raise_on_timeout=True):
-        remaining = self._timeout - (time.time() - self._start)
+        remaining = self._timeout - (runtime.current_app.hub.now - self._start)
         if remaining < 0 and raise_on_timeout:
             self.timeout()
         return remaining
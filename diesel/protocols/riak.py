@@ -175,7 +175,7 @@ class Bucket(object):
             inq.put(k)
 
         for x in xrange(min(len(keys), concurrency_limit)):
-            diesel.fork(self._subrequest, inq, outq)
+            diesel.spawn_task(self._subrequest, inq, outq)
 
         failure = False
         okay, err = [], []
@@ -0,0 +1,128 @@
+# vim:ts=4:sw=4:expandtab
+'''Access to a few Linux system calls that Python 2's standard
+library doesn't expose.
+
+Everything here degrades gracefully: when the call isn't available
+(not on Linux, no ctypes, old libc), a portable fallback is used or
+the name is set to None so callers can pick another path.
+'''
+import os
+import time
+
+try:
+    import ctypes
+    import ctypes.util
+except ImportError:
+    ctypes = None
+
+def _load_libc(dll_type='CDLL'):
+    if ctypes is None:
+        return None
+    for name in (ctypes.util.find_library('c'), 'libc.so.6'):
+        if not name:
+            continue
+        try:
+            return getattr(ctypes, dll_type)(name, use_errno=True)
+        except OSError:
+            pass
+    return None
+
+libc = _load_libc()
+
+# For quick calls that shouldn't bother releasing the GIL
+libc_nogil = _load_libc('PyDLL')
+
+CLOCK_MONOTONIC = 1
+
+if ctypes is not None:
+    class timespec(ctypes.Structure):
+        _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+def _make_clock(clock_id):
+    '''Return a function reading `clock_id` as float seconds, or None
+    if clock_gettime() can't be reached.
+    '''
+    if libc_nogil is None or not hasattr(libc_nogil, 'clock_gettime'):
+        return None
+    clock_gettime = libc_nogil.clock_gettime
+    clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(timespec)]
+    if clock_gettime(clock_id, ctypes.byref(timespec())) != 0:
+        return None
+    # A fresh timespec for every call: the hub, the thread pool and the
+    # watchdog all read the clock, and another thread can run between
+    # clock_gettime() returning and the fields being read.
+    def clock():
+        ts = timespec()
+        clock_gettime(clock_id, ctypes.byref(ts))
+        return ts.tv_sec + ts.tv_nsec * 1e-9
+    return clock
+
+monotonic = getattr(time, 'monotonic', None) or \
+            _make_clock(CLOCK_MONOTONIC) or time.time
+
+def _make_setaffinity():
+    if hasattr(os, 'sched_setaffinity'):
+        return lambda cpus: os.sched_setaffinity(0, cpus)
+    if libc is None or not hasattr(libc, 'sched_setaffinity'):
+        return None
+    sched_setaffinity = libc.sched_setaffinity
+    # a cpu_set_t, as glibc defines it: 1024 bits
+    words = 1024 // (8 * ctypes.sizeof(ctypes.c_ulong))
+    cpu_set_t = ctypes.c_ulong * words
+    bits = 8 * ctypes.sizeof(ctypes.c_ulong)
+    def set_cpu_affinity(cpus):
+        mask = cpu_set_t()
+        for c in cpus:
+            mask[c // bits] |= 1 << (c % bits)
+        if sched_setaffinity(0, ctypes.sizeof(mask), ctypes.byref(mask)) != 0:
+            e = ctypes.get_errno()
+            raise OSError(e, os.strerror(e))
+    return set_cpu_affinity
+
+# set_cpu_affinity(cpus) pins the calling process to the given CPU numbers
+set_cpu_affinity = _make_setaffinity()
+
+EFD_NONBLOCK = 0o4000
+EFD_CLOEXEC = 0o2000000
+
+def _make_eventfd():
+    if hasattr(os, 'eventfd'):
+        return lambda: os.eventfd(0, os.EFD_NONBLOCK | os.EFD_CLOEXEC)
+    if libc is None or not hasattr(libc, 'eventfd'):
+        return None
+    def eventfd():
+        fd = libc.eventfd(0, EFD_NONBLOCK | EFD_CLOEXEC)
+        if fd < 0:
+            e = ctypes.get_errno()
+            raise OSError(e, os.strerror(e))
+        return fd
+    return eventfd
+
+# eventfd() returns a new non-blocking eventfd descriptor
+eventfd = _make_eventfd()
+
+def _make_sendfile():
+    if hasattr(os, 'sendfile'):
+        return os.sendfile
+    if libc is None:
+        return None
+    # sendfile64 takes a 64-bit offset even on 32-bit builds
+    call = getattr(libc, 'sendfile64', None) or getattr(libc, 'sendfile', None)
+    if call is None:
+        return None
+    call.argtypes = [ctypes.c_int, ctypes.c_int,
+            ctypes.POINTER(ctypes.c_int64), ctypes.c_size_t]
+    call.restype = ctypes.c_ssize_t
+    def sendfile(out_fd, in_fd, offset, count):
+        off = ctypes.c_int64(offset)
+        sent = call(out_fd, in_fd, ctypes.byref(off), count)
+        if sent < 0:
+            e = ctypes.get_errno()
+            raise OSError(e, os.strerror(e))
+        return sent
+    return sendfile
+
+# sendfile(out_fd, in_fd, offset, count) copies up to `count` bytes of
+# in_fd, starting at `offset`, to out_fd inside the kernel; it returns
+# the number of bytes sent and leaves in_fd's file position alone
+sendfile = _make_sendfile()
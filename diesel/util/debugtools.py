@@ -10,6 +10,10 @@ import diesel
 
 address_stripper = re.compile(r' at 0x[0-9a-f]+')
 
+def loop_name(loop):
+    """A loop's label, without the memory address."""
+    return address_stripper.sub('', loop.loop_label)
+
 def print_greenlet_stacks():
     """Prints the stacks of greenlets from running loops.
 
@@ -31,6 +35,5 @@ def print_greenlet_stacks():
         loops[stack] = obj
     for stack, count in sorted(stacks.iteritems(), key=itemgetter(1)):
         loop = loops[stack]
-        loop_id = address_stripper.sub('', str(loop.loop_callable))
-        print '[%d] === %s ===' % (count, loop_id)
+        print '[%d] === %s ===' % (count, loop_name(loop))
         print stack
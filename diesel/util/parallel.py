@@ -0,0 +1,145 @@
+'''Fork-join helpers: run callables on child loops and collect results.
+
+`gather`, `parallel_map` and `as_completed` run each callable on a
+child Task, at most `limit` (by default 100; None for no limit) at a
+time.  If one raises, the rest are cancelled and the exception is
+raised in the caller; the same goes for a `timeout`, which raises
+ParallelTimeout.
+'''
+import sys
+from functools import partial
+
+import diesel
+from diesel import runtime
+from diesel.core import ParentDiedException, TerminateLoop
+from diesel.syscall import monotonic
+from diesel.util.queue import Queue, QueueEmpty, QueueTimeout
+
+class ParallelTimeout(Exception):
+    '''Raised when the results aren't all in by the timeout.
+    '''
+
+class Batch(object):
+    '''The child loops started for one call, and their results.
+    '''
+    def __init__(self):
+        self.results = Queue(fair=False)
+        self.running = {}
+        self.cancelled = False
+
+    def start(self, index, f):
+        t = diesel.spawn_child_task(self._run_one, index, f)
+        self.running[index] = (t, t.id)
+
+    def _run_one(self, index, f):
+        try:
+            value = f()
+        except (TerminateLoop, ParentDiedException):
+            raise
+        except Exception:
+            result = (index, False, sys.exc_info())
+        else:
+            result = (index, True, value)
+        finally:
+            self.running.pop(index, None)
+        if not self.cancelled:
+            self.results.put(result)
+
+    def next_result(self, deadline):
+        if deadline is None:
+            return self.results.get()
+        left = deadline - monotonic()
+        try:
+            if left <= 0:
+                return self.results.get(waiting=False)
+            return self.results.get(timeout=left)
+        except (QueueEmpty, QueueTimeout):
+            raise ParallelTimeout()
+
+    def cancel(self):
+        '''Terminate the loops that are still running.
+
+        A loop that is already due to be woken by a fire() can't be
+        interrupted; it is terminated on a later pass, once the fired
+        value has been delivered.  Its result is dropped.
+        '''
+        self.cancelled = True
+        if not self.running:
+            return
+        hub = runtime.current_app.hub
+        def kill(loops):
+            later = []
+            for t, id in loops:
+                # a Task could be running someone else's function by now
+                if not t.running or t.id != id:
+                    continue
+                if t.fire_due:
+                    later.append((t, id))
+                else:
+                    t.wake(TerminateLoop())
+            if later:
+                hub.schedule(partial(kill, later))
+        hub.schedule(partial(kill, self.running.values()))
+        self.running.clear()
+
+def run(calls, limit=None, timeout=None, ordered=True):
+    '''Run the callables from the iterator `calls` and yield their
+    results, in order or as they complete.
+
+    No more than `limit` callables are taken from `calls` ahead of the
+    results yielded so far, so an ordered run buffers at most `limit`
+    results waiting for an earlier one.
+    '''
+    batch = Batch()
+    deadline = monotonic() + timeout if timeout else None
+    done = {}
+    started = yielded = 0
+    exhausted = False
+    try:
+        while True:
+            while not exhausted and (limit is None or started - yielded < limit):
+                try:
+                    f = calls.next()
+                except StopIteration:
+                    exhausted = True
+                else:
+                    batch.start(started, f)
+                    started += 1
+            if ordered and yielded in done:
+                value = done.pop(yielded)
+                yielded += 1
+                yield value
+                continue
+            if exhausted and yielded == started:
+                return
+            index, ok, value = batch.next_result(deadline)
+            if not ok:
+                raise value[0], value[1], value[2]
+            if ordered:
+                done[index] = value
+            else:
+                yielded += 1
+                yield value
+    finally:
+        batch.cancel()
+
+def gather(callables, limit=100, timeout=None):
+    '''Call each of `callables` on a child loop, and return a list of
+    their results, in the same order.
+    '''
+    return list(run(iter(callables), limit, timeout))
+
+def parallel_map(f, iterable, limit=100, timeout=None):
+    '''Like imap(f, iterable), calling f on child loops, at most
+    `limit` at a time.
+
+    Items are taken from `iterable` only as results are consumed, so
+    a large (or endless) iterable is fine.
+    '''
+    return run((partial(f, item) for item in iterable), limit, timeout)
+
+def as_completed(callables, limit=100, timeout=None):
+    '''Call each of `callables` on a child loop, and yield their results
+    as they come in.
+    '''
+    return run(iter(callables), limit, timeout, ordered=False)
@@ -118,7 +118,7 @@ class ThreadPool(object):
             while True:
                 for x in xrange(self.concurrency - self.running):
                     self.running += 1
-                    fork(self.handler_wrap)
+                    spawn_task(self.handler_wrap)
 
                 if self.waiting == 0:
                     self.trigger.wait()
@@ -3,27 +3,93 @@ import random
 from collections import deque
 from contextlib import contextmanager
 
-from diesel import fire, sleep, first
+from diesel import fire, sleep, first, wait
 from diesel.events import Waiter, StopWaitDispatch
+from diesel.syscall import monotonic
 
 class QueueEmpty(Exception): pass
+class QueueFull(Exception): pass
 class QueueTimeout(Exception): pass
 
+class QueueSpace(Waiter):
+    '''Fired when items leave a bounded `Queue`, to wake blocked puts.
+
+    Each fire wakes no more producers than there are free slots.
+    '''
+    def __init__(self, queue):
+        self.queue = queue
+        self.waiting = 0
+        self.granted = 0
+
+    def process_fire(self, value):
+        q = self.queue
+        if self.granted >= q.maxsize - len(q.inp):
+            raise StopWaitDispatch()
+        self.granted += 1
+        return value
+
 class Queue(Waiter):
-    def __init__(self):
+    '''A FIFO queue for passing items between loops.
+
+    With a `maxsize`, put() suspends the caller while the queue holds
+    that many items.  When `fair` is true (the default), get() yields
+    to other loops after taking an item that was already queued, so
+    one fast consumer can't starve the rest; turn it off to take
+    queued items without a trip through the hub.
+    '''
+    def __init__(self, maxsize=0, fair=True):
         self.inp = deque()
+        self.maxsize = maxsize
+        self.fair = fair
+        self.space = QueueSpace(self) if maxsize else None
 
-    def put(self, i=None):
+    def put(self, i=None, waiting=True, timeout=None):
+        if self.space is not None and len(self.inp) >= self.maxsize:
+            if not waiting:
+                raise QueueFull()
+            self._wait_for_space(timeout)
         self.inp.append(i)
         fire(self)
 
+    def _wait_for_space(self, timeout):
+        space = self.space
+        if timeout:
+            deadline = monotonic() + timeout
+        while len(self.inp) >= self.maxsize:
+            space.waiting += 1
+            try:
+                if timeout:
+                    left = deadline - monotonic()
+                    if left <= 0:
+                        raise QueueTimeout()
+                    mark, val = first(sleep=left, waits=[space])
+                    if mark != space:
+                        raise QueueTimeout()
+                else:
+                    wait(space)
+            finally:
+                space.waiting -= 1
+                if not space.waiting:
+                    space.granted = 0
+            if space.granted:
+                space.granted -= 1
+
+    def _taken(self):
+        space = self.space
+        if space is not None and space.waiting:
+            fire(space)
+
     def get(self, waiting=True, timeout=None):
         if self.inp:
             val = self.inp.popleft()
-            sleep()
+            self._taken()
+            if self.fair:
+                sleep()
             return val
         mark = None
 
+        if waiting and not timeout:
+            return wait(self)
         if waiting:
             kw = dict(waits=[self])
             if timeout:
@@ -36,6 +102,31 @@ class Queue(Waiter):
 
         raise QueueEmpty()
 
+    def get_many(self, max_items=None, waiting=True, timeout=None):
+        '''Return a list of up to `max_items` items (all that are
+        queued, by default), waiting only if the queue is empty.
+        '''
+        if max_items is not None and max_items <= 0:
+            return []
+        if self.inp:
+            items = []
+        else:
+            items = [self.get(waiting, timeout)]
+        inp = self.inp
+        n = len(inp)
+        if max_items is not None:
+            n = min(n, max_items - len(items))
+        for x in xrange(n):
+            items.append(inp.popleft())
+        if n > 0:
+            self._taken()
+        return items
+
+    def drain(self):
+        '''Return a list of everything queued, without waiting.
+        '''
+        return self.get_many(waiting=False) if self.inp else []
+
     def __iter__(self):
         return self
 
@@ -46,31 +137,132 @@ class Queue(Waiter):
     def is_empty(self):
         return not bool(self.inp)
 
+    @property
+    def is_full(self):
+        return bool(self.maxsize) and len(self.inp) >= self.maxsize
+
     def process_fire(self, value):
         if self.inp:
-            return self.inp.popleft()
+            val = self.inp.popleft()
+            self._taken()
+            return val
         else:
             raise StopWaitDispatch()
 
     def ready_early(self):
         return not self.is_empty
 
-class Fanout(object):
+class SharedFeed(Waiter):
+    '''The messages of a shared `Fanout`, kept once for all subscribers.
+
+    Each message is stored, with the count of subscribers yet to read
+    it, under its sequence number; it is dropped once they all have.
+    '''
     def __init__(self):
+        self.messages = {}
+        self.start = 0
+        self.end = 0
+
+    def add(self, m, readers):
+        self.messages[self.end] = [m, readers]
+        self.end += 1
+        fire(self)
+
+    def read(self, seq):
+        entry = self.messages[seq]
+        entry[1] -= 1
+        if entry[1] == 0:
+            self._trim()
+        return entry[0]
+
+    def leave(self, seq):
+        for s in xrange(seq, self.end):
+            self.messages[s][1] -= 1
+        self._trim()
+
+    def _trim(self):
+        messages = self.messages
+        while self.start < self.end and messages[self.start][1] == 0:
+            del messages[self.start]
+            self.start += 1
+
+class SharedSub(object):
+    '''A subscriber's view of a shared `Fanout`; reads like a `Queue`.
+    '''
+    def __init__(self, feed):
+        self.feed = feed
+        self.pos = feed.end
+
+    def get(self, waiting=True, timeout=None):
+        feed = self.feed
+        if self.pos < feed.end:
+            val = self._take()
+            sleep()
+            return val
+
+        if waiting and not timeout:
+            wait(feed)
+            return self._take()
+        if waiting:
+            kw = dict(waits=[feed])
+            if timeout:
+                kw['sleep'] = timeout
+            mark, val = first(**kw)
+            if mark == feed:
+                return self._take()
+            else:
+                raise QueueTimeout()
+
+        raise QueueEmpty()
+
+    def _take(self):
+        val = self.feed.read(self.pos)
+        self.pos += 1
+        return val
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        return self.get()
+
+    @property
+    def is_empty(self):
+        return self.pos >= self.feed.end
+
+class Fanout(object):
+    '''Publish messages to every current subscriber.
+
+    By default each subscriber gets a `Queue` of its own, and `pub`
+    puts the message on every one of them.  With `shared=True`, a
+    message is stored once, and a single fire() wakes all the
+    subscribers waiting for it; better when there are many.
+    '''
+    def __init__(self, shared=False):
         self.subs = set()
+        self.feed = SharedFeed() if shared else None
 
     def pub(self, m):
+        if self.feed is not None:
+            if self.subs:
+                self.feed.add(m, len(self.subs))
+            return
         for s in self.subs:
             s.put(m)
 
     @contextmanager
     def sub(self):
-        q = Queue()
+        if self.feed is not None:
+            q = SharedSub(self.feed)
+        else:
+            q = Queue()
         self.subs.add(q)
         try:
             yield q
         finally:
             self.subs.remove(q)
+            if self.feed is not None:
+                self.feed.leave(q.pos)
 
 class Dispatcher(object):
     def __init__(self):
@@ -0,0 +1,132 @@
+'''A sampling profiler that knows which loop it caught.
+
+Unlike DIESEL_PROFILE's cProfile, which hooks every call and muddles
+time across greenlet switches, this takes a sample every `interval`
+seconds of CPU time (from an ITIMER_PROF timer): the stack of whatever
+is running, filed under the running loop's label, or '<hub>' when
+the hub itself is.  A sample of a 40-frame stack takes about 30
+microseconds, so at the default 100 samples a second it costs well
+under 1%; it can be left running against live traffic, and started
+and stopped from the remote console:
+
+    >>> from diesel.util import sampling
+    >>> sampling.start()
+    >>> sampling.write_collapsed('/tmp/diesel.stacks')
+    >>> sampling.stop()
+
+The output has one "label;outer;...;inner count" line per distinct
+stack, the collapsed format that flamegraph.pl and speedscope read.
+
+Samples can only be taken on the main thread, which is where the
+hub runs.
+'''
+import signal
+
+from greenlet import getcurrent
+
+from diesel import core
+from diesel import runtime
+from diesel.util.debugtools import address_stripper
+
+class SamplingProfiler(object):
+    def __init__(self, interval=0.01, max_depth=128):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.counts = {}
+        self.samples = 0
+        self.running = False
+        self._old_handler = None
+
+    def start(self):
+        if self.running:
+            return
+        self._old_handler = signal.signal(signal.SIGPROF, self._sample)
+        # restart interrupted system calls rather than fail them
+        signal.siginterrupt(signal.SIGPROF, False)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+        self.running = True
+
+    def stop(self):
+        if not self.running:
+            return
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, self._old_handler or signal.SIG_DFL)
+        self.running = False
+
+    def reset(self):
+        self.counts = {}
+        self.samples = 0
+
+    def _sample(self, sig, frame):
+        codes = []
+        depth = self.max_depth
+        while frame is not None and depth:
+            codes.append(frame.f_code)
+            frame = frame.f_back
+            depth -= 1
+        key = (self._label(), tuple(codes))
+        self.counts[key] = self.counts.get(key, 0) + 1
+        self.samples += 1
+
+    def _label(self):
+        app = runtime.current_app
+        current = getcurrent()
+        if app is not None and current is getattr(app, 'runhub', None):
+            return '<hub>'
+        loop = core.current_loop
+        if loop is not None and loop.coroutine is current:
+            if loop.loop_callable is None:
+                # a Task between runs
+                return '<task>'
+            return loop.loop_label
+        return '<main>'
+
+    def collapsed(self):
+        '''The samples so far, as a list of collapsed-stack lines.
+        '''
+        merged = {}
+        for (label, codes), count in self.counts.iteritems():
+            names = [clean(address_stripper.sub('', label))]
+            names.extend(frame_name(co) for co in reversed(codes))
+            line = ';'.join(names)
+            merged[line] = merged.get(line, 0) + count
+        return ['%s %d' % item for item in sorted(merged.iteritems())]
+
+    def write_collapsed(self, out):
+        '''Write collapsed stacks to `out`, a file name or a file.
+        '''
+        lines = self.collapsed()
+        if isinstance(out, basestring):
+            with open(out, 'w') as f:
+                f.writelines(l + '\n' for l in lines)
+        else:
+            out.writelines(l + '\n' for l in lines)
+
+def clean(name):
+    return name.replace(';', ':').replace('\n', ' ')
+
+def frame_name(co):
+    return clean('%s (%s:%d)' % (co.co_name, co.co_filename, co.co_firstlineno))
+
+profiler = None
+
+def start(interval=0.01):
+    '''Start (or resume) sampling; returns the SamplingProfiler.
+    '''
+    global profiler
+    if profiler is None:
+        profiler = SamplingProfiler(interval)
+    profiler.start()
+    return profiler
+
+def stop():
+    if profiler is not None:
+        profiler.stop()
+
+def reset():
+    if profiler is not None:
+        profiler.reset()
+
+def write_collapsed(out):
+    if profiler is not None:
+        profiler.write_collapsed(out)
@@ -1,5 +1,9 @@
+import time
+from collections import deque
 
 from diesel import core
+from diesel import runtime
+from diesel.util.debugtools import address_stripper
 
 class CPUStats(object):
     def __init__(self):
@@ -15,3 +19,198 @@ class CPUStats(object):
             end_clock = self.caller.clocktime()
             self.cpu_seconds = end_clock - self.start_clock
 
+def labelled(spent):
+    out = {}
+    for key, seconds in spent.iteritems():
+        # without the address, every loop running the same function
+        # adds up under one label, as debugtools.loop_name() has it
+        label = address_stripper.sub('', str(key))
+        out[label] = out.get(label, 0.0) + seconds
+    return out
+
+class CPUAccounting(object):
+    '''Time spent running each loop, added up by loop label.
+
+    Every time the hub wakes a loop, the time until the loop hands
+    control back is charged to its label.  Since the hub runs one loop
+    at a time on one thread, that is the hub time the loop took--CPU
+    time, plus any blocking calls it made.  It is read from the wall
+    clock, which costs far less than os.times(); unlike
+    Loop.enable_tracking(), this is cheap enough to leave on.
+
+    Totals are kept in `bucket`-second slices for the last `history`
+    seconds, so top() can look at a recent window.
+    '''
+    clock = time.time
+
+    def __init__(self, bucket=1.0, history=300.0):
+        self.bucket = bucket
+        self.slices = deque(maxlen=max(int(history / bucket), 1))
+        self.current = {}
+        self.current_start = time.time()
+
+    def add(self, label, start):
+        '''Charge the time since `start` to `label` (a loop's label, or
+        its callable, standing in for str(callable)).  Memory addresses
+        are left out of the labels that totals() and top() report.
+        '''
+        now = time.time()
+        if now - self.current_start >= self.bucket:
+            self.slices.append((self.current_start, labelled(self.current)))
+            self.current = {}
+            self.current_start = now
+        spent = now - start
+        if spent > 0:
+            current = self.current
+            current[label] = current.get(label, 0.0) + spent
+
+    def totals(self, window=60.0):
+        '''Seconds spent per loop label over the last `window` seconds
+        (to the nearest bucket).
+        '''
+        since = time.time() - window
+        totals = labelled(self.current)
+        for start, spent in self.slices:
+            if start + self.bucket <= since:
+                continue
+            for label, seconds in spent.iteritems():
+                totals[label] = totals.get(label, 0.0) + seconds
+        return totals
+
+    def top(self, n=10, window=60.0):
+        '''The `n` loop labels that took the most hub time over the last
+        `window` seconds, as a list of (label, seconds), busiest first.
+        '''
+        totals = self.totals(window)
+        return sorted(totals.iteritems(), key=lambda t: t[1], reverse=True)[:n]
+
+def enable_cpu_accounting(app=None, bucket=1.0, history=300.0):
+    '''Start charging hub time to loop labels; returns the
+    CPUAccounting.  It can also be switched on at startup by setting
+    DIESEL_CPU_ACCOUNTING in the environment.
+    '''
+    app = app or runtime.current_app
+    if app.cpu_accounting is None:
+        app.cpu_accounting = CPUAccounting(bucket, history)
+    return app.cpu_accounting
+
+def disable_cpu_accounting(app=None):
+    app = app or runtime.current_app
+    app.cpu_accounting = None
+
+def top_loops(n=10, window=60.0):
+    '''The busiest loop labels of the running application; see
+    CPUAccounting.top().
+    '''
+    accounting = runtime.current_app.cpu_accounting
+    if accounting is None:
+        return []
+    return accounting.top(n, window)
+
+class Histogram(object):
+    '''Counts of recorded values in power-of-two buckets.
+
+    Values are multiplied by `scale` first (1e6 turns seconds into
+    microseconds); bucket i then holds values from 2**(i-1) up to
+    2**i, and bucket 0 anything under 1.  Recording is a handful of
+    arithmetic operations, and percentiles are read from the buckets,
+    so they are upper bounds within a factor of two.
+    '''
+    def __init__(self, scale=1e6):
+        self.scale = scale
+        self.reset()
+
+    def reset(self):
+        self.buckets = [0] * 65
+        self.count = 0
+        self.total = 0.0
+        self.max = 0
+
+    def record(self, value):
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+        n = int(value * self.scale)
+        if n > 0:
+            # len(bin(n)) - 2 is n.bit_length(), which 2.6 lacks
+            self.buckets[len(bin(n)) - 2] += 1
+        else:
+            self.buckets[0] += 1
+
+    def percentile(self, p):
+        if not self.count:
+            return 0
+        wanted = self.count * p / 100.0
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= wanted:
+                return min((2 ** i) / self.scale, self.max)
+        return self.max
+
+    def summary(self):
+        return dict(
+            count=self.count,
+            mean=self.total / self.count if self.count else 0,
+            max=self.max,
+            p50=self.percentile(50),
+            p90=self.percentile(90),
+            p99=self.percentile(99),
+        )
+
+class HubMetrics(object):
+    '''Histograms of how the hub is keeping up.
+
+    - run_queue: callbacks waiting in the run queue at the start of
+      each pass through the hub
+    - wake_latency: seconds from a loop being made runnable (by being
+      started, a fire(), sleep(0) or a value handed back early) to it
+      running
+    - timer_lateness: seconds past its trigger time a timer ran
+    - poll_time: seconds spent in each poll for events
+    - poll_events: the number of events each poll returned
+    - busy_time: seconds each pass spent running callbacks, outside
+      of the poll
+
+    On the libev hub, only polls that block are counted, and
+    poll_events is the number of callbacks the watchers queued.
+    '''
+    NAMES = ('run_queue', 'wake_latency', 'timer_lateness', 'poll_time',
+            'poll_events', 'busy_time')
+    COUNTS = ('run_queue', 'poll_events')
+
+    def __init__(self):
+        for name in self.NAMES:
+            setattr(self, name, Histogram(1 if name in self.COUNTS else 1e6))
+
+    def reset(self):
+        for name in self.NAMES:
+            getattr(self, name).reset()
+
+    def summary(self):
+        return dict((name, getattr(self, name).summary())
+                for name in self.NAMES)
+
+def enable_hub_metrics(app=None):
+    '''Start recording HubMetrics on the application's hub; returns them.
+
+    With metrics off (the default) the hub only checks that its
+    `metrics` is None.  DIESEL_HUB_METRICS switches them on at startup.
+    '''
+    hub = (app or runtime.current_app).hub
+    if hub.metrics is None:
+        hub.metrics = HubMetrics()
+    return hub.metrics
+
+def disable_hub_metrics(app=None):
+    (app or runtime.current_app).hub.metrics = None
+
+def hub_metrics():
+    '''A summary (count, mean, max and percentiles) of each of the hub's
+    histograms, or None if metrics are off.
+    '''
+    metrics = runtime.current_app.hub.metrics
+    if metrics is None:
+        return None
+    return metrics.summary()
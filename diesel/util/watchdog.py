@@ -0,0 +1,122 @@
+'''A watchdog thread that reports when the hub stalls.
+
+Everything on a hub waits while one loop runs, so a loop that makes a
+blocking call, or computes for too long, holds up every connection.
+The watchdog checks, from a thread of its own, how long ago the hub
+last came back around its event loop (the hub's `heartbeat`, set every
+pass); if that is over `threshold` seconds while the hub isn't just
+waiting in poll, it logs the label of the loop that's running and
+the main thread's stack, and counts the stall against that label.
+
+    >>> from diesel.util import watchdog
+    >>> watchdog.start(threshold=0.1)
+    >>> watchdog.stall_counts()
+    {'<function handler>': 3}
+
+It can also be started with DIESEL_WATCHDOG set to the threshold in
+milliseconds.  A stall inside a C call that holds the GIL is only seen
+once the call returns.
+'''
+import sys
+import threading
+import time
+import traceback
+from collections import defaultdict
+
+from diesel import core
+from diesel import log
+from diesel import runtime
+from diesel.syscall import monotonic
+from diesel.util.debugtools import loop_name
+
+class StallWatchdog(object):
+    def __init__(self, app=None, threshold=0.1):
+        self.app = app or runtime.current_app
+        self.threshold = threshold
+        self.stalls = defaultdict(int)
+        self.main_thread = threading.current_thread().ident
+        # each start() gets a thread of its own; stop() retires it
+        self.generation = 0
+        self.running = False
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.generation += 1
+        t = threading.Thread(target=self._watch, args=(self.generation,),
+                name='diesel-watchdog')
+        t.daemon = True
+        t.start()
+
+    def stop(self):
+        self.running = False
+        self.generation += 1
+
+    def _watch(self, generation):
+        reported = None
+        while (generation == self.generation and
+                runtime.current_app is self.app):
+            time.sleep(self.threshold / 2.0)
+            hub = self.app.hub
+            if hub.polling:
+                continue
+            heartbeat = hub.heartbeat
+            if monotonic() - heartbeat < self.threshold:
+                continue
+            if heartbeat == reported:
+                # still the same stall
+                continue
+            reported = heartbeat
+            self.report(monotonic() - heartbeat)
+
+    def report(self, stalled):
+        label, stack = self.running_stack()
+        self.stalls[label] += 1
+        log.warning("Hub stalled for {0:.0f}ms in {1}:\n{2}",
+                stalled * 1000, label, stack)
+
+    def running_stack(self):
+        '''The label of whatever has the hub, and its stack.
+        '''
+        frame = sys._current_frames().get(self.main_thread)
+        if frame is None:
+            return '<unknown>', ''
+        stack = traceback.format_stack(frame)
+        outer = frame
+        while outer.f_back is not None:
+            outer = outer.f_back
+        # a loop's greenlet starts in its run(); anything else is the hub
+        loop = core.current_loop
+        if loop is not None and outer.f_code in loop_run_codes:
+            label = loop_name(loop)
+        else:
+            label = '<hub>'
+        return label, ''.join(stack)
+
+loop_run_codes = (core.Loop.run.im_func.func_code,
+        core.Task.run.im_func.func_code)
+
+watchdog = None
+
+def start(threshold=0.1, app=None):
+    '''Start watching the running application's hub; returns the
+    StallWatchdog.
+    '''
+    global watchdog
+    if watchdog is None or watchdog.app is not (app or runtime.current_app):
+        watchdog = StallWatchdog(app, threshold)
+    watchdog.threshold = threshold
+    watchdog.start()
+    return watchdog
+
+def stop():
+    if watchdog is not None:
+        watchdog.stop()
+
+def stall_counts():
+    '''Stalls seen so far, by loop label.
+    '''
+    if watchdog is None:
+        return {}
+    return dict(watchdog.stalls)
@@ -0,0 +1,37 @@
+"""A benchmark for the input Buffer.
+
+    $ python examples/buffer_bench.py
+
+Times an until() whose sentinel arrives after 2MB of small chunks, and
+2MB consumed by many receive(16) calls. Both would take minutes if
+feeding or consuming copied the whole buffered remainder each time.
+
+"""
+import time
+
+from diesel.buffer import Buffer
+
+def long_until_scan(chunks=4000):
+    b = Buffer()
+    chunk = "x" * 512
+    start = time.time()
+    b.set_term("\r\n")
+    for i in xrange(chunks):
+        b.feed(chunk)
+    res = b.feed("\r\n")
+    assert len(res) == chunks * 512 + 2
+    print "until() over %d chunks: %.3fs" % (chunks, time.time() - start)
+
+def many_small_receives(size=2 ** 21):
+    b = Buffer()
+    b.feed("x" * size)
+    start = time.time()
+    for i in xrange(size / 16):
+        b.set_term(16)
+        b.check()
+    assert not b.has_data
+    print "%d receive(16) calls: %.3fs" % (size / 16, time.time() - start)
+
+if __name__ == '__main__':
+    long_until_scan()
+    many_small_receives()
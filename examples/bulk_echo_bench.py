@@ -0,0 +1,51 @@
+"""A bulk-transfer echo benchmark.
+
+A client pushes large payloads through an echo service on localhost and
+reads them back, reporting throughput. Compare level- and edge-triggered
+epoll with:
+
+    $ python examples/bulk_echo_bench.py
+    $ DIESEL_EDGE_TRIGGERED=1 python examples/bulk_echo_bench.py
+
+Optional arguments are the payload size in MB and the number of round
+trips (defaults: 1 and 50).
+
+"""
+import sys
+import time
+
+import diesel
+from diesel import Client, Service, call, receive, send
+from diesel import runtime
+
+def echo(addr):
+    while True:
+        send(receive())
+
+class BulkClient(Client):
+    @call
+    def round_trip(self, payload):
+        send(payload)
+        left = len(payload)
+        while left:
+            left -= len(receive())
+
+def main(service):
+    size = int(float(sys.argv[1]) * 1024 * 1024) if len(sys.argv) > 1 else 2 ** 20
+    trips = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    payload = 'x' * size
+    client = BulkClient('localhost', service.port)
+    start = time.time()
+    for i in xrange(trips):
+        client.round_trip(payload)
+    elapsed = time.time() - start
+    hub = runtime.current_app.hub
+    mode = "edge-triggered" if hub.edge_triggered else "level-triggered"
+    print "%s: %d x %d bytes echoed in %.2fs (%.1f MB/s each way)" % (
+            mode, trips, size, elapsed, size * trips / elapsed / 2 ** 20)
+    diesel.quickstop()
+
+if __name__ == '__main__':
+    diesel.set_log_level(diesel.loglevels.ERROR)
+    service = Service(echo, 0)
+    diesel.quickstart(service, lambda: main(service))
@@ -0,0 +1,65 @@
+"""Report the memory cost of an idle connection.
+
+    $ python examples/conn_memory_bench.py [connections]
+
+A child process opens that many connections (default 5000) to a service
+whose handler just waits for input, and the server's resident size is
+compared before and after. The figure covers everything one connection
+keeps alive on our side: its Loop and greenlet, Connection, Buffer,
+Pipeline, and the hub's bookkeeping for the socket.
+
+The server and the child each need a file descriptor per connection,
+so raise `ulimit -n` for large counts.
+
+"""
+import gc
+import os
+import socket
+import sys
+import time
+
+import diesel
+from diesel import Service, receive, runtime
+
+def idle(addr):
+    receive()
+
+def rss():
+    for line in open('/proc/self/status'):
+        if line.startswith('VmRSS:'):
+            return int(line.split()[1]) * 1024
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def open_connections(port, n):
+    socks = []
+    for i in xrange(n):
+        socks.append(socket.create_connection(('localhost', port)))
+    time.sleep(3600)
+
+def main(service, n):
+    gc.collect()
+    before = rss()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            open_connections(service.port, n)
+        finally:
+            os._exit(0)
+    app = runtime.current_app
+    # wait until they've all been accepted and their loops are parked
+    while len(app.hub.fdmap) < n + 1:
+        diesel.sleep(0.05)
+    diesel.sleep(0.2)
+    gc.collect()
+    after = rss()
+    print "%d idle connections: %.0f bytes each" % (n, (after - before) / float(n))
+    os.kill(pid, 9)
+    os.waitpid(pid, 0)
+    diesel.quickstop()
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    diesel.set_log_level(diesel.loglevels.ERROR)
+    service = Service(idle, 0)
+    diesel.quickstart(service, lambda: main(service, n))
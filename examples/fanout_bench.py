@@ -0,0 +1,51 @@
+"""A benchmark for Fanout with many subscribers.
+
+examples/fanout.py, scaled up and without the printing. Try:
+
+    $ python examples/fanout_bench.py
+    $ python examples/fanout_bench.py 10000 100 shared
+
+Arguments are the number of subscribers, the number of messages to
+publish (defaults: 10000 and 50) and optionally "shared", to use a
+Fanout(shared=True), which keeps one copy of each message for all
+subscribers instead of putting it on a queue per subscriber.
+
+"""
+import sys
+import time
+
+import diesel
+from diesel.util.queue import Fanout
+from diesel.util.event import Countdown
+
+LISTENERS = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+EVENTS = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+SHARED = 'shared' in sys.argv[3:]
+
+f = Fanout(shared=True) if SHARED else Fanout()
+subscribed = Countdown(LISTENERS)
+received = Countdown(LISTENERS * EVENTS)
+
+def listener():
+    with f.sub() as q:
+        subscribed.tick()
+        while True:
+            q.get()
+            received.tick()
+
+def teller():
+    subscribed.wait()
+    start = time.time()
+    for x in xrange(EVENTS):
+        f.pub(x)
+        diesel.sleep()
+    received.wait()
+    elapsed = time.time() - start
+    print "%s: %d messages to %d subscribers in %.2fs (%.2f usec/delivery)" % (
+            "shared" if SHARED else "queues", EVENTS, LISTENERS, elapsed,
+            elapsed / (EVENTS * LISTENERS) * 1e6)
+    diesel.quickstop()
+
+if __name__ == '__main__':
+    diesel.set_log_level(diesel.loglevels.ERROR)
+    diesel.quickstart(teller, *[listener] * LISTENERS)
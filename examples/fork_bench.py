@@ -0,0 +1,43 @@
+"""How many short-lived tasks per second can be started?
+
+    $ python examples/fork_bench.py [count] [batch]
+
+Tasks are started in batches (default 100), waiting for each batch to
+finish before starting the next, like a per-request fan-out.  Each task
+does almost nothing--it ticks a countdown--so the numbers are the cost
+of starting, running and finishing a task: diesel.fork() makes a new
+Loop and greenlet every time, while diesel.spawn_task() reuses pooled
+ones.
+
+"""
+import sys
+import time
+
+import diesel
+from diesel.util.event import Countdown
+
+def task(done):
+    done.tick()
+
+def measure(name, start_task, n, batch):
+    start = time.time()
+    for b in xrange(n // batch):
+        done = Countdown(batch)
+        for i in xrange(batch):
+            start_task(task, done)
+        done.wait()
+    n = n // batch * batch
+    elapsed = time.time() - start
+    print "%-10s %d tasks in %.2fs (%.0f/sec)" % (name, n, elapsed, n / elapsed)
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    batch = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    measure('fork', diesel.fork, n, batch)
+    if hasattr(diesel, 'spawn_task'):
+        measure('spawn_task', diesel.spawn_task, n, batch)
+    diesel.quickstop()
+
+if __name__ == '__main__':
+    diesel.set_log_level(diesel.loglevels.ERROR)
+    diesel.quickstart(main)
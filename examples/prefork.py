@@ -0,0 +1,17 @@
+'''An echo server running on several worker processes.
+
+Each worker runs its own hub; the supervisor restarts any that crash.
+Try connecting a few times with telnet and note the pid in the replies,
+or kill -9 a worker and watch it come back.
+'''
+import os
+
+from diesel import Application, Service, until_eol, send
+
+def echo(addr):
+    while True:
+        send("[%s] %s" % (os.getpid(), until_eol()))
+
+app = Application(workers=4, reuseport=True, cpu_affinity=True)
+app.add_service(Service(echo, 8013))
+app.run()
@@ -1,3 +1,14 @@
+"""Workers pulling items off a shared Queue.
+
+Pass a mode to compare the ways of taking items:
+
+    $ python examples/queue_fairness_and_speed.py          # diesel.wait(q)
+    $ python examples/queue_fairness_and_speed.py get      # q.get()
+    $ python examples/queue_fairness_and_speed.py unfair   # Queue(fair=False)
+    $ python examples/queue_fairness_and_speed.py many     # q.get_many(100)
+
+"""
+import sys
 import time
 import uuid
 
@@ -7,18 +18,30 @@ from diesel.util.queue import Queue
 
 NUM_ITEMS = 100000
 NUM_WORKERS = 10
+MODE = sys.argv[1] if len(sys.argv) > 1 else 'wait'
 
 shutdown = uuid.uuid4().hex
-q = Queue()
+q = Queue(fair=(MODE != 'unfair'))
 dones = Queue()
 
+def take():
+    if MODE == 'wait':
+        return [diesel.wait(q)]
+    if MODE == 'many':
+        return q.get_many(100)
+    return [q.get()]
+
 def worker():
     num_processed = 0
     while True:
-        val = diesel.wait(q)
-        if val == shutdown:
+        vals = take()
+        if shutdown in vals:
+            # leave the rest of the shutdown markers for the others
+            for v in vals[vals.index(shutdown) + 1:]:
+                q.put(v)
+            num_processed += vals.index(shutdown)
             break
-        num_processed += 1
+        num_processed += len(vals)
     fmt_args = (diesel.core.current_loop, num_processed)
     print "%s, worker done (processed %d items)" % fmt_args
     dones.put('done')
@@ -36,7 +59,7 @@ def main():
     for i in xrange(NUM_WORKERS):
         dones.get()
 
-    print 'all workers done in %.2f secs' % (time.time() - start)
+    print '%s: all workers done in %.2f secs' % (MODE, time.time() - start)
     diesel.quickstop()
 
 if __name__ == '__main__':
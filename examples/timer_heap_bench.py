@@ -0,0 +1,60 @@
+"""A benchmark for the hub's timer queue with many pending timers.
+
+Try something like:
+
+    $ python examples/timer_heap_bench.py
+    $ python examples/timer_heap_bench.py 1000 10000 100000 1000000
+
+For each count, that many long-lived timers are left pending on the hub
+(think idle-connection timeouts). Then a churn of short-lived timers is run
+against them, the same way `first(sleep=...)` creates and cancels one per
+call. The script prints the per-operation cost at each size; with the heap
+it should stay roughly flat as the pending count grows.
+
+"""
+import sys
+import time
+
+import diesel
+from diesel import runtime
+
+CHURN = 20000
+DEFAULT_SIZES = [1000, 10000, 100000, 1000000]
+
+def noop():
+    pass
+
+def measure(pending):
+    hub = runtime.current_app.hub
+    start = time.time()
+    parked = [hub.call_later(3600 + i, noop) for i in xrange(pending)]
+    diesel.sleep() # let the hub move them onto the timer queue
+    setup = time.time() - start
+
+    start = time.time()
+    for i in xrange(CHURN):
+        t = hub.call_later(60, noop)
+        if i % 100 == 0:
+            diesel.sleep() # run a hub pass now and then
+        t.cancel()
+    diesel.sleep()
+    churn = time.time() - start
+
+    start = time.time()
+    for t in parked:
+        t.cancel()
+    diesel.sleep()
+    teardown = time.time() - start
+
+    print "%8d pending: setup %.2fs, %.2f usec/churn op, teardown %.2fs" % (
+            pending, setup, churn / CHURN * 1e6, teardown)
+
+def main():
+    sizes = [int(a) for a in sys.argv[1:]] or DEFAULT_SIZES
+    for n in sizes:
+        measure(n)
+    diesel.quickstop()
+
+if __name__ == '__main__':
+    diesel.set_log_level(diesel.loglevels.ERROR)
+    diesel.quickstart(main)
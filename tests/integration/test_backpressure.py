@@ -0,0 +1,86 @@
+import socket
+
+from diesel import (Client, Service, SendBufferFull, call, core, flush,
+                    receive, runtime, send, set_watermarks, sleep,
+                    thread)
+from diesel.util.event import Event
+
+MSG = 'x' * 1024
+HIGH = 64 * 1024
+
+class Reader(Client):
+    @call
+    def read(self, n):
+        return receive(n)
+
+def start(handler):
+    service = Service(handler, 0)
+    runtime.current_app.add_service(service)
+    return service
+
+def slow_reader(port):
+    # a plain socket, so nothing reads ahead of us; and a small receive
+    # buffer, to keep the kernel from soaking up everything that's sent
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 16384)
+    sock.connect(('localhost', port))
+    return sock
+
+def read_all(sock, n):
+    got = 0
+    while got < n:
+        got += len(sock.recv(min(n - got, 2 ** 20)))
+    return got
+
+def test_send_blocks_at_high_water():
+    N = 20000
+    state = {'max': 0, 'sent': 0}
+    done = Event()
+    def handler(addr):
+        set_watermarks(HIGH)
+        pipeline = core.current_loop.connection_stack[-1].pipeline
+        for i in xrange(N):
+            send(MSG)
+            state['sent'] += 1
+            state['max'] = max(state['max'], pipeline.size)
+        done.set()
+    service = start(handler)
+    sock = slow_reader(service.port)
+    sleep(0.2)
+    assert state['sent'] < N, "sender never blocked"
+    assert thread(read_all, sock, N * len(MSG)) == N * len(MSG)
+    done.wait()
+    assert state['max'] <= HIGH + len(MSG)
+    sock.close()
+
+def test_send_raises_when_not_blocking():
+    result = []
+    def handler(addr):
+        set_watermarks(HIGH, block=False)
+        try:
+            while True:
+                send(MSG)
+        except SendBufferFull:
+            result.append('full')
+    service = start(handler)
+    client = Reader('localhost', service.port)
+    for i in xrange(500):
+        if result:
+            break
+        sleep(0.01)
+    assert result == ['full']
+    client.close()
+
+def test_flush():
+    flushed = Event()
+    def handler(addr):
+        send(MSG * 10)
+        flush()
+        assert core.current_loop.connection_stack[-1].pipeline.empty
+        flushed.set()
+        receive(1)
+    service = start(handler)
+    client = Reader('localhost', service.port)
+    flushed.wait()
+    assert client.read(len(MSG) * 10) == MSG * 10
+    client.close()
@@ -0,0 +1,41 @@
+import time
+
+import diesel
+from diesel import runtime
+from diesel.util.event import Event
+from diesel.util.stats import (disable_cpu_accounting, enable_cpu_accounting,
+                               top_loops)
+
+def busy(done):
+    diesel.label('busy-loop')
+    for i in xrange(5):
+        end = time.time() + 0.02
+        while time.time() < end:
+            pass
+        diesel.sleep()
+    done.set()
+
+def idle(done):
+    diesel.label('idle-loop')
+    for i in xrange(5):
+        diesel.sleep()
+    done.set()
+
+def test_top_loops():
+    assert top_loops() == []
+    acct = enable_cpu_accounting()
+    try:
+        assert runtime.current_app.cpu_accounting is acct
+        dones = [Event(), Event()]
+        diesel.fork(busy, dones[0])
+        diesel.fork(idle, dones[1])
+        for d in dones:
+            d.wait()
+        top = dict(top_loops(window=10))
+        # the first slice is charged before the loop labels itself
+        assert top['busy-loop'] >= 0.07
+        assert top['idle-loop'] < 0.05
+        assert top_loops(1)[0][0] == 'busy-loop'
+    finally:
+        disable_cpu_accounting()
+    assert top_loops() == []
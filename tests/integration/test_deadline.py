@@ -0,0 +1,158 @@
+import socket
+import time
+
+import diesel
+from diesel import (Client, DeadlineExceeded, Service, call, deadline, runtime,
+                    send, sleep, time_left, until_eol, wait)
+from diesel.util.event import Event
+from diesel.util.queue import Queue
+
+def expect_deadline(f, *args):
+    t = time.time()
+    try:
+        f(*args)
+    except DeadlineExceeded:
+        return time.time() - t
+    assert 0, "expected DeadlineExceeded"
+
+def test_sleep_past_deadline():
+    with deadline(0.05):
+        took = expect_deadline(sleep, 1)
+    assert 0.04 < took < 0.5
+
+def test_short_sleep_finishes():
+    with deadline(0.5):
+        sleep(0.01)
+        assert 0 < time_left() < 0.5
+    assert time_left() is None
+
+def test_wait_is_called_off():
+    with deadline(0.02):
+        expect_deadline(wait, 'never-fired')
+    assert 'never-fired' not in runtime.current_app.waits.waits
+    assert diesel.core.current_loop not in runtime.current_app.waits.loop_refs
+
+def test_queue_get():
+    q = Queue()
+    with deadline(0.02):
+        expect_deadline(q.get)
+    q.put(1)
+    with deadline(0.02):
+        assert q.get() == 1
+
+def test_nested_deadline_cannot_extend():
+    with deadline(0.05):
+        with deadline(10):
+            took = expect_deadline(sleep, 1)
+        assert took < 0.5
+
+def test_nested_deadline_can_shorten():
+    with deadline(10):
+        with deadline(0.02):
+            expect_deadline(sleep, 1)
+        assert time_left() > 5
+
+def test_already_passed():
+    with deadline(0.01):
+        time.sleep(0.02)
+        took = expect_deadline(wait, 'never-fired')
+        assert took < 0.01
+        # not a wait the deadline can call off
+        sleep()
+
+def test_child_loops_inherit_the_deadline():
+    done = Event()
+    result = []
+    def child():
+        try:
+            sleep(1)
+        except DeadlineExceeded:
+            result.append('deadline')
+        done.set()
+    with deadline(0.02):
+        diesel.fork_child(child)
+    done.wait()
+    assert result == ['deadline']
+
+def test_forked_loops_do_not():
+    done = Event()
+    result = []
+    def other():
+        assert time_left() is None
+        result.append(True)
+        done.set()
+    with deadline(0.02):
+        diesel.fork(other)
+    done.wait()
+    assert result == [True]
+
+class SlowEcho(Client):
+    @call
+    def echo(self, msg):
+        send(msg + '\r\n')
+        return until_eol()
+
+def slow_echo(addr):
+    while True:
+        line = until_eol()
+        sleep(0.1)
+        send(line)
+
+def test_receive_then_recover():
+    service = Service(slow_echo, 0)
+    runtime.current_app.add_service(service)
+    client = SlowEcho('localhost', service.port)
+    with deadline(0.02):
+        expect_deadline(client.echo, 'a')
+    # the late reply to 'a' is still on its way; the connection is fine
+    assert client.echo('b') == 'a\r\n'
+    assert client.echo('c') == 'b\r\n'
+    client.close()
+
+def test_connect_honors_deadline():
+    # a listener that never accepts, with its backlog filled up, leaves
+    # further connects hanging
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(0)
+    port = listener.getsockname()[1]
+    filler = []
+    for i in xrange(5):
+        s = socket.socket()
+        s.setblocking(0)
+        try:
+            s.connect(('127.0.0.1', port))
+        except socket.error:
+            pass
+        filler.append(s)
+    sleep(0.05)
+    try:
+        with deadline(0.05):
+            took = expect_deadline(Client, '127.0.0.1', port)
+        assert took < 0.5
+    finally:
+        for s in filler + [listener]:
+            s.close()
+
+def test_pooled_task_forgets_the_deadline():
+    tasks = []
+    done = Event()
+    def child():
+        tasks.append(diesel.core.current_loop)
+        done.set()
+    with deadline(0.02):
+        diesel.spawn_child_task(child)
+        done.wait()
+    sleep(0.05) # the deadline has passed; the task is parked
+    result = []
+    done = Event()
+    def later():
+        tasks.append(diesel.core.current_loop)
+        result.append((time_left(), diesel.core.current_loop.parent))
+        sleep(0.01)
+        done.set()
+    diesel.spawn_task(later)
+    ev, _ = diesel.first(sleep=1, waits=[done])
+    assert ev == done, "the task inherited the old deadline"
+    assert tasks[0] is tasks[1]
+    assert result == [(None, None)]
@@ -0,0 +1,30 @@
+import socket
+
+from diesel import core, runtime, sleep
+
+TOTAL = 64 * 1024
+
+def test_drain_beyond_io_budget():
+    hub = runtime.current_app.hub
+    saved = hub.edge_triggered, hub.io_budget
+    a, b = socket.socketpair()
+    a.setblocking(0)
+    # all of it is waiting before the socket is registered, so epoll
+    # reports a single edge; nothing will report the rest
+    b.sendall('x' * TOTAL)
+    hub.edge_triggered = True
+    hub.io_budget = 4096
+    try:
+        conn = core.Connection(a, 'pair')
+        assert a.fileno() in hub._edge_fds
+        sizes = []
+        while conn.buffer.size < TOTAL and len(sizes) < 100:
+            sleep()
+            sizes.append(conn.buffer.size)
+        assert conn.buffer.size == TOTAL
+        # it took more than one pass: the budget cut each read short
+        assert [s for s in sizes if 0 < s < TOTAL]
+    finally:
+        hub.edge_triggered, hub.io_budget = saved
+        conn.shutdown()
+        b.close()
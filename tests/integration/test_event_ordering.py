@@ -64,7 +64,7 @@ class FakeConnection(object):
         self.conn_id = conn_id
         self.delay = delay
 
-    def check_incoming(self, condition, callback):
+    def check_incoming(self, condition, callback, max_length=None):
         diesel.fork(self.delayed_value)
         return None
 
@@ -2,13 +2,13 @@ import uuid
 
 import diesel
 
-from diesel.util.queue import Fanout
+from diesel.util.queue import Fanout, QueueEmpty, QueueTimeout
 from diesel.util.event import Countdown
 
 class FanoutHarness(object):
     def setup(self):
         self.done = Countdown(10)
-        self.fan = Fanout()
+        self.fan = self.make_fanout()
         self.subscriber_data = {}
         for x in xrange(10):
             diesel.fork(self.subscriber)
@@ -24,6 +24,9 @@ class FanoutHarness(object):
                 data.append(q.get())
         self.done.tick()
 
+    def make_fanout(self):
+        return Fanout()
+
 class TestFanout(FanoutHarness):
     def test_all_subscribers_get_the_published_messages(self):
         assert len(self.subscriber_data) == 10
@@ -33,3 +36,55 @@ class TestFanout(FanoutHarness):
     def test_sub_is_removed_after_it_is_done(self):
         assert not self.fan.subs
 
+
+class TestSharedFanout(TestFanout):
+    def make_fanout(self):
+        return Fanout(shared=True)
+
+    def test_messages_are_dropped_once_read(self):
+        assert not self.fan.feed.messages
+        assert self.fan.feed.start == self.fan.feed.end == 10
+
+class TestSharedFanoutSubscribers(object):
+    def setup(self):
+        self.fan = Fanout(shared=True)
+
+    def test_pub_without_subscribers_keeps_nothing(self):
+        self.fan.pub(1)
+        assert not self.fan.feed.messages
+
+    def test_late_subscriber_only_sees_later_messages(self):
+        with self.fan.sub() as early:
+            self.fan.pub(1)
+            with self.fan.sub() as late:
+                self.fan.pub(2)
+                assert late.get() == 2
+                assert late.is_empty
+            assert early.get() == 1
+            assert early.get() == 2
+        assert not self.fan.feed.messages
+
+    def test_leaving_releases_unread_messages(self):
+        with self.fan.sub() as q:
+            with self.fan.sub():
+                for i in xrange(5):
+                    self.fan.pub(i)
+            assert len(self.fan.feed.messages) == 5
+            assert q.get() == 0
+            assert len(self.fan.feed.messages) == 4
+        assert not self.fan.feed.messages
+
+    def test_get_without_waiting(self):
+        with self.fan.sub() as q:
+            try:
+                q.get(waiting=False)
+            except QueueEmpty:
+                pass
+            else:
+                assert 0, "expected QueueEmpty"
+            try:
+                q.get(timeout=0.01)
+            except QueueTimeout:
+                pass
+            else:
+                assert 0, "expected QueueTimeout"
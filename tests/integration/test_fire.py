@@ -1,5 +1,6 @@
 from diesel import fork, fire, wait, sleep, first
-from diesel.util.event import Event
+from diesel import runtime
+from diesel.util.event import Countdown, Event
 
 def test_basic_fire():
     done = Event()
@@ -63,3 +64,40 @@ def test_fire_miss():
     ev, _ = first(sleep=1, waits=[done])
     assert v[0] == 0 # should not have woken up!
 
+
+def test_fire_wakes_many_with_one_run_queue_entry():
+    hub = runtime.current_app.hub
+    ready = Countdown(100)
+    done = Countdown(100)
+    got = []
+    def w(i):
+        ready.tick()
+        got.append((i, wait("many")))
+        done.tick()
+
+    for i in xrange(100):
+        fork(w, i)
+    ready.wait()
+    sleep()
+    before = len(hub.run_now)
+    fire("many", "v")
+    assert len(hub.run_now) == before + 1
+    assert len(hub.fired) == 100
+    ev, _ = first(sleep=1, waits=[done])
+    assert ev is done
+    assert sorted(got) == [(i, "v") for i in xrange(100)]
+    assert not hub.fired
+
+def test_fired_wakes_run_as_one_batch():
+    order = []
+    def waiter(what):
+        wait(what)
+        order.append(what)
+    fork(waiter, 'a')
+    fork(waiter, 'b')
+    sleep()
+    fire('a')
+    runtime.current_app.hub.schedule(lambda: order.append('scheduled'))
+    fire('b')
+    sleep()
+    assert order == ['a', 'b', 'scheduled']
@@ -1,4 +1,7 @@
+import time
+
 from diesel import fork, sleep, first, Loop, fork_child, ParentDiedException
+from diesel import core, spawn_task, spawn_child_task, thread, TerminateLoop
 from diesel.util.event import Event
 from diesel import runtime
 
@@ -151,3 +154,115 @@ def test_child_keep_alive_dies_with_parent():
     assert not children[0].running
     assert not parent.children
 
+
+def test_spawn_task():
+    got = []
+    done = Event()
+    def task(a, b=None):
+        got.append((a, b))
+        done.set()
+    spawn_task(task, 1, b=2)
+    done.wait()
+    assert got == [(1, 2)]
+
+def test_spawn_task_reuses_tasks():
+    loops = []
+    ids = []
+    def task(done):
+        loops.append(core.current_loop)
+        ids.append(core.current_loop.id)
+        done.set()
+    for i in xrange(3):
+        done = Event()
+        spawn_task(task, done)
+        done.wait()
+        sleep() # let the task finish up and park
+    assert loops[0] is loops[1] is loops[2]
+    assert len(set(ids)) == 3
+
+def test_spawn_task_survives_exceptions():
+    done = Event()
+    def bad():
+        a = b # undef
+    def good():
+        done.set()
+    for i in xrange(10):
+        spawn_task(bad)
+    spawn_task(good)
+    done.wait()
+
+def test_spawn_child_task_dies_with_parent():
+    got_exception = [0]
+    def parent():
+        spawn_child_task(dependent_child, got_exception)
+        sleep(0.1)
+
+    l = Loop(parent)
+    runtime.current_app.add_loop(l)
+    sleep()
+    while l.running:
+        sleep()
+    sleep() # the child is told on the next pass
+    assert got_exception[0], "child didn't die when parent died!"
+
+def test_spawn_child_task_keep_alive():
+    children = [None]
+    runs = [0]
+    def flapping_task():
+        runs[0] += 1
+        sleep(0.1)
+    def parent():
+        child = spawn_child_task(flapping_task)
+        child.keep_alive = True
+        sleep(1.5)
+    l = Loop(parent)
+    runtime.current_app.add_loop(l)
+    sleep()
+    while l.running:
+        sleep()
+    assert runs[0] > 1, runs[0]
+    seen = runs[0]
+    sleep(1)
+    assert runs[0] == seen, "keep-alive task outlived its parent"
+
+def test_task_ignores_wakes_for_its_previous_run():
+    tasks = []
+    def blocked():
+        tasks.append(core.current_loop)
+        thread(time.sleep, 0.2)
+    t = spawn_task(blocked)
+    sleep()
+    runtime.current_app.hub.schedule(lambda: t.wake(TerminateLoop()))
+    sleep() # let it die and park
+    result = []
+    done = Event()
+    def sleeper():
+        tasks.append(core.current_loop)
+        start = time.time()
+        result.append(sleep(0.5))
+        result.append(time.time() - start)
+        done.set()
+    spawn_task(sleeper)
+    done.wait()
+    assert tasks[0] is tasks[1]
+    assert result[0] is True
+    assert result[1] > 0.45, result
+
+def test_keep_alive_child_not_restarted_after_parent_died():
+    # the child dies first; the parent dies while the child is waiting
+    # out its restart delay
+    runs = [0]
+    def crashing_child():
+        runs[0] += 1
+        raise ValueError("crash")
+    def parent():
+        child = fork_child(crashing_child)
+        child.keep_alive = True
+        sleep(0.1)
+    l = Loop(parent)
+    runtime.current_app.add_loop(l)
+    sleep()
+    while l.running:
+        sleep()
+    sleep(1)
+    assert runs[0] == 1, runs[0]
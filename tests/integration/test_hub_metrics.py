@@ -0,0 +1,105 @@
+import errno
+import time
+
+import diesel
+from diesel import runtime
+from diesel.util.event import Event
+from diesel.util import sampling
+from diesel.util.stats import (disable_hub_metrics, enable_hub_metrics,
+                               hub_metrics)
+
+def sleeper(done):
+    for i in xrange(5):
+        diesel.sleep()
+    diesel.sleep(0.05)
+    done.set()
+
+def test_hub_metrics():
+    assert hub_metrics() is None
+    metrics = enable_hub_metrics()
+    try:
+        assert runtime.current_app.hub.metrics is metrics
+        done = Event()
+        diesel.fork(sleeper, done)
+        done.wait()
+        summary = hub_metrics()
+        # one pass through the hub for each sleep()
+        assert summary['run_queue']['count'] >= 5
+        assert summary['wake_latency']['count'] >= 6
+        assert summary['timer_lateness']['count'] >= 1
+        assert summary['poll_time']['max'] > 0.01
+        assert summary['busy_time']['count'] >= 1
+        for name, h in summary.iteritems():
+            assert h['p50'] <= h['p99'] <= h['max']
+    finally:
+        disable_hub_metrics()
+    assert hub_metrics() is None
+
+def test_starting_a_loop_counts_as_a_wake():
+    metrics = enable_hub_metrics()
+    try:
+        started = []
+        diesel.fork(started.append, 'loop')
+        diesel.spawn_task(started.append, 'task')
+        diesel.sleep(0.01)
+        assert sorted(started) == ['loop', 'task']
+        assert metrics.wake_latency.count >= 2, metrics.wake_latency.count
+    finally:
+        disable_hub_metrics()
+
+class InterruptedEpoll(object):
+    '''An epoll whose next poll() fails with EINTR, as it does when a
+    signal arrives.'''
+    def __init__(self, epoll):
+        self.epoll = epoll
+        self.interrupt = True
+
+    def poll(self, timeout):
+        if self.interrupt:
+            self.interrupt = False
+            raise IOError(errno.EINTR, 'Interrupted system call')
+        return self.epoll.poll(timeout)
+
+    def __getattr__(self, name):
+        return getattr(self.epoll, name)
+
+def record_busy_time(metrics):
+    recorded = []
+    record = metrics.busy_time.record
+    def spy(value):
+        recorded.append(value)
+        record(value)
+    metrics.busy_time.record = spy
+    return recorded
+
+def test_interrupted_poll():
+    hub = runtime.current_app.hub
+    metrics = enable_hub_metrics()
+    recorded = record_busy_time(metrics)
+    diesel.sleep() # from the next pass on, the hub records metrics
+    hub.epoll = InterruptedEpoll(hub.epoll)
+    try:
+        for i in xrange(3):
+            diesel.sleep()
+        assert not hub.epoll.interrupt
+        assert recorded and min(recorded) >= 0, recorded
+        assert metrics.poll_time.count >= 3, metrics.poll_time.count
+    finally:
+        hub.epoll = hub.epoll.epoll
+        disable_hub_metrics()
+
+def test_with_the_sampling_profiler():
+    metrics = enable_hub_metrics()
+    recorded = record_busy_time(metrics)
+    sampling.start(0.001)
+    try:
+        for i in xrange(10):
+            end = time.time() + 0.01
+            while time.time() < end:
+                pass
+            diesel.sleep(0.005)
+    finally:
+        sampling.stop()
+        sampling.reset()
+        disable_hub_metrics()
+    assert recorded and min(recorded) >= 0, recorded
@@ -0,0 +1,160 @@
+import time
+
+import diesel
+
+from diesel.util.parallel import (
+    Batch, ParallelTimeout, as_completed, gather, parallel_map,
+)
+
+class Tracker(object):
+    '''Counts how many calls run at once, and which ones finished.'''
+    def __init__(self):
+        self.active = 0
+        self.max_active = 0
+        self.finished = []
+
+    def call(self, value, delay=0.01):
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            diesel.sleep(delay)
+        finally:
+            self.active -= 1
+        self.finished.append(value)
+        return value
+
+class Boom(Exception): pass
+
+def fail(delay=0.0):
+    diesel.sleep(delay)
+    raise Boom()
+
+class TestGather(object):
+    def setup(self):
+        self.tracker = Tracker()
+
+    def test_results_are_in_order(self):
+        calls = [lambda i=i: self.tracker.call(i, 0.05 - i * 0.01)
+                for i in xrange(5)]
+        assert gather(calls) == range(5)
+        assert self.tracker.finished == range(4, -1, -1)
+
+    def test_runs_concurrently(self):
+        t = time.time()
+        gather([lambda: self.tracker.call(None, 0.1)] * 10)
+        assert time.time() - t < 0.5
+        assert self.tracker.max_active == 10
+
+    def test_limit(self):
+        calls = [lambda i=i: self.tracker.call(i) for i in xrange(20)]
+        assert gather(calls, limit=3) == range(20)
+        assert self.tracker.max_active == 3
+
+    def test_default_limit(self):
+        calls = [lambda: self.tracker.call(None, 0.05)] * 150
+        gather(calls)
+        assert self.tracker.max_active == 100
+
+    def test_first_exception_cancels_the_rest(self):
+        calls = [lambda: self.tracker.call(1, 0.2), lambda: fail(0.01)]
+        try:
+            gather(calls)
+        except Boom:
+            pass
+        else:
+            assert 0, "expected Boom"
+        diesel.sleep(0.3)
+        assert self.tracker.finished == []
+        assert self.tracker.active == 0
+
+    def test_timeout_cancels(self):
+        t = time.time()
+        try:
+            gather([lambda: self.tracker.call(1, 0.5)], timeout=0.05)
+        except ParallelTimeout:
+            pass
+        else:
+            assert 0, "expected ParallelTimeout"
+        assert time.time() - t < 0.3
+        diesel.sleep(0.6)
+        assert self.tracker.finished == []
+
+    def test_cancel_reaches_a_child_woken_by_fire(self):
+        steps = []
+        def waiter():
+            diesel.wait('parallel-go')
+            steps.append('woken')
+            diesel.sleep(0.1)
+            steps.append('finished')
+        batch = Batch()
+        batch.start(0, waiter)
+        diesel.sleep()
+        batch.cancel()
+        # by the time the cancel gets to it, the waiter is due to be
+        # woken by this and can't be interrupted yet
+        diesel.fire('parallel-go')
+        diesel.sleep(0.2)
+        assert steps == ['woken']
+        assert batch.results.is_empty
+
+    def test_empty(self):
+        assert gather([]) == []
+
+class TestParallelMap(object):
+    def setup(self):
+        self.tracker = Tracker()
+        self.taken = 0
+
+    def items(self, n):
+        for i in xrange(n):
+            self.taken += 1
+            yield i
+
+    def test_ordered_results(self):
+        results = parallel_map(lambda i: self.tracker.call(i * 2, 0.001 * (i % 3)),
+                self.items(50), limit=5)
+        assert list(results) == range(0, 100, 2)
+        assert self.tracker.max_active <= 5
+
+    def test_iterable_is_consumed_lazily(self):
+        results = parallel_map(lambda i: self.tracker.call(i, 0), self.items(10 ** 6),
+                limit=10)
+        for i, v in enumerate(results):
+            assert v == i
+            assert self.taken - i <= 10
+            if i == 100:
+                break
+        results.close()
+        assert self.taken < 200
+
+class TestAsCompleted(object):
+    def setup(self):
+        self.tracker = Tracker()
+
+    def test_results_as_they_finish(self):
+        calls = [lambda i=i: self.tracker.call(i, 0.1 - i * 0.02)
+                for i in xrange(5)]
+        assert list(as_completed(calls)) == range(4, -1, -1)
+
+    def test_exception_propagates(self):
+        calls = [lambda: self.tracker.call(1, 0.01), lambda: fail(0.05),
+                lambda: self.tracker.call(2, 0.3)]
+        got = []
+        try:
+            for v in as_completed(calls):
+                got.append(v)
+        except Boom:
+            pass
+        else:
+            assert 0, "expected Boom"
+        assert got == [1]
+        diesel.sleep(0.4)
+        assert self.tracker.finished == [1]
+
+    def test_closing_cancels_the_rest(self):
+        calls = [lambda i=i: self.tracker.call(i, 0.05 * i) for i in xrange(1, 4)]
+        results = as_completed(calls)
+        assert results.next() == 1
+        results.close()
+        diesel.sleep(0.3)
+        assert self.tracker.finished == [1]
@@ -0,0 +1,133 @@
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+WORKER = '''
+import os, sys
+from diesel import Application, Loop, Service, send
+def handler(addr):
+    send('%d\\n' % os.getpid())
+Application.RESTART_DELAY = 0.1
+app = Application(workers=2, reuseport=(sys.argv[2] == 'reuseport'),
+                  cpu_affinity=True)
+app.add_service(Service(handler, int(sys.argv[1]), iface='127.0.0.1'))
+if sys.argv[2] == 'exit':
+    app.add_loop(Loop(sys.exit))
+app.run()
+'''
+
+def free_port():
+    s = socket.socket()
+    s.bind(('127.0.0.1', 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+def children(pid):
+    found = set()
+    for name in os.listdir('/proc'):
+        if not name.isdigit():
+            continue
+        try:
+            stat = open('/proc/%s/stat' % name).read()
+        except IOError:
+            continue
+        # the command name can contain spaces; the ppid follows it
+        if int(stat.rsplit(')', 1)[1].split()[1]) == pid:
+            found.add(int(name))
+    return found
+
+def wait_for(check, timeout=10):
+    end = time.time() + timeout
+    while time.time() < end:
+        result = check()
+        if result:
+            return result
+        time.sleep(0.05)
+    assert 0, "timed out"
+
+def ask(port):
+    try:
+        s = socket.create_connection(('127.0.0.1', port), 1)
+        try:
+            return int(s.makefile().readline())
+        finally:
+            s.close()
+    except (socket.error, ValueError):
+        return None
+
+def fd_kinds(pid):
+    kinds = []
+    for fd in os.listdir('/proc/%d/fd' % pid):
+        try:
+            kinds.append(os.readlink('/proc/%d/fd/%s' % (pid, fd)))
+        except OSError:
+            pass
+    return kinds
+
+def cpus_allowed(pid):
+    for line in open('/proc/%d/status' % pid):
+        if line.startswith('Cpus_allowed_list:'):
+            return line.split(':')[1].strip()
+
+def start(mode):
+    port = free_port()
+    proc = subprocess.Popen([sys.executable, '-c', WORKER, str(port), mode],
+            stdout=open(os.devnull, 'w'), stderr=subprocess.STDOUT,
+            close_fds=True)
+    return port, proc
+
+def stop(proc):
+    if proc.poll() is None:
+        for pid in children(proc.pid):
+            os.kill(pid, signal.SIGKILL)
+        proc.kill()
+        proc.wait()
+
+def supervise(mode):
+    port, proc = start(mode)
+    try:
+        workers = wait_for(lambda: len(children(proc.pid)) == 2
+                and children(proc.pid))
+        wait_for(lambda: ask(port) in workers)
+
+        # each worker has its own epoll and wakeup descriptors, and
+        # nothing left over from the supervisor's hub
+        for pid in workers:
+            kinds = fd_kinds(pid)
+            assert kinds.count('anon_inode:[eventpoll]') == 1, kinds
+            assert kinds.count('anon_inode:[eventfd]') == 1, kinds
+            assert ',' not in cpus_allowed(pid)
+            assert '-' not in cpus_allowed(pid)
+
+        victim = sorted(workers)[0]
+        os.kill(victim, signal.SIGKILL)
+        respawned = wait_for(lambda: len(children(proc.pid)) == 2
+                and victim not in children(proc.pid) and children(proc.pid))
+        for i in xrange(10):
+            served = wait_for(lambda: ask(port))
+            assert served in respawned
+
+        proc.send_signal(signal.SIGTERM)
+        wait_for(lambda: proc.poll() is not None)
+        assert proc.returncode == 0
+        assert not children(proc.pid)
+    finally:
+        stop(proc)
+
+def test_workers_are_restarted():
+    supervise('shared')
+
+def test_workers_are_restarted_with_reuseport():
+    supervise('reuseport')
+
+def test_workers_calling_sys_exit_are_not_restarted():
+    port, proc = start('exit')
+    try:
+        wait_for(lambda: proc.poll() is not None)
+        assert proc.returncode == 0
+    finally:
+        stop(proc)
@@ -1,10 +1,11 @@
 import random
+import time
 
 from collections import defaultdict
 
 import diesel
 
-from diesel.util.queue import Queue, QueueTimeout
+from diesel.util.queue import Queue, QueueEmpty, QueueFull, QueueTimeout
 from diesel.util.event import Countdown, Event
 
 
@@ -96,3 +97,132 @@ class TestQueueTimeouts(object):
 
     def test_a_consumer_got_a_value(self):
         assert self.result.is_set
+
+class TestBoundedQueue(object):
+    def setup(self):
+        self.queue = Queue(maxsize=2)
+        self.log = []
+
+    def producer(self, name, n):
+        for i in xrange(n):
+            self.queue.put((name, i))
+            self.log.append(('put', name, i))
+
+    def test_put_blocks_while_full(self):
+        diesel.fork(self.producer, 'a', 5)
+        diesel.sleep()
+        assert len(self.log) == 2
+        assert self.queue.is_full
+        assert self.queue.get() == ('a', 0)
+        diesel.sleep()
+        assert len(self.log) == 3
+        got = [self.queue.get() for i in xrange(4)]
+        assert got == [('a', i) for i in xrange(1, 5)]
+        assert self.queue.is_empty
+
+    def test_blocked_puts_each_get_a_slot(self):
+        for name in 'abcd':
+            diesel.fork(self.producer, name, 3)
+        got = []
+        while len(got) < 12:
+            got.extend(self.queue.get_many(waiting=True))
+            assert len(self.queue.inp) <= 2
+        for name in 'abcd':
+            assert [i for n, i in got if n == name] == [0, 1, 2]
+        assert not self.queue.space.waiting
+        assert not self.queue.space.granted
+
+    def test_put_timeout(self):
+        self.queue.put(1)
+        self.queue.put(2)
+        t = time.time()
+        try:
+            self.queue.put(3, timeout=0.05)
+        except QueueTimeout:
+            pass
+        else:
+            assert 0, "expected QueueTimeout"
+        assert time.time() - t >= 0.04
+        assert list(self.queue.inp) == [1, 2]
+        assert not self.queue.space.waiting
+
+    def test_put_without_waiting(self):
+        self.queue.put(1)
+        self.queue.put(2)
+        try:
+            self.queue.put(3, waiting=False)
+        except QueueFull:
+            pass
+        else:
+            assert 0, "expected QueueFull"
+
+class TestQueueBatches(object):
+    def setup(self):
+        self.queue = Queue()
+
+    def test_get_many_takes_what_is_queued(self):
+        for i in xrange(10):
+            self.queue.put(i)
+        assert self.queue.get_many(4) == [0, 1, 2, 3]
+        assert self.queue.get_many() == range(4, 10)
+        assert self.queue.is_empty
+
+    def test_get_many_waits_for_the_first_item(self):
+        def producer():
+            diesel.sleep(0.01)
+            for i in xrange(3):
+                self.queue.put(i)
+        diesel.fork(producer)
+        assert self.queue.get_many() == [0, 1, 2]
+
+    def test_get_many_timeout_and_empty(self):
+        try:
+            self.queue.get_many(timeout=0.01)
+        except QueueTimeout:
+            pass
+        else:
+            assert 0, "expected QueueTimeout"
+        try:
+            self.queue.get_many(waiting=False)
+        except QueueEmpty:
+            pass
+        else:
+            assert 0, "expected QueueEmpty"
+
+    def test_get_many_of_no_items(self):
+        assert self.queue.get_many(0, timeout=0.01) == []
+        self.queue.put('a')
+        assert self.queue.get_many(0) == []
+        assert self.queue.get_many() == ['a']
+
+    def test_drain(self):
+        assert self.queue.drain() == []
+        self.queue.put('a')
+        self.queue.put('b')
+        assert self.queue.drain() == ['a', 'b']
+        assert self.queue.drain() == []
+
+class TestQueueFairness(object):
+    def count_yields(self, queue):
+        ticks = [0]
+        stop = []
+        def ticker():
+            while not stop:
+                diesel.sleep()
+                ticks[0] += 1
+        diesel.fork(ticker)
+        diesel.sleep()
+        before = ticks[0]
+        for i in xrange(10):
+            queue.put(i)
+        for i in xrange(10):
+            queue.get()
+        yields = ticks[0] - before
+        stop.append(True)
+        return yields
+
+    def test_fair_get_yields(self):
+        assert self.count_yields(Queue()) >= 10
+
+    def test_unfair_get_does_not_yield(self):
+        assert self.count_yields(Queue(fair=False)) == 0
@@ -0,0 +1,92 @@
+import socket
+
+from diesel import (Service, core, receive, runtime, set_input_limit, sleep,
+                    thread)
+from diesel.core import BUFSIZ
+from diesel.util.event import Event
+
+LIMIT = 64 * 1024
+TOTAL = 8 * 2 ** 20
+
+def test_hub_disable_read():
+    hub = runtime.current_app.hub
+    a, b = socket.socketpair()
+    a.setblocking(0)
+    reads = []
+    hub.register(a, lambda: reads.append(a.recv(100)), None, None)
+    try:
+        hub.disable_read(a)
+        b.send("hi")
+        sleep(0.05)
+        assert reads == []
+        hub.enable_write(a)
+        hub.disable_write(a) # shouldn't turn reads back on
+        sleep(0.05)
+        assert reads == []
+        hub.enable_read(a)
+        sleep(0.05)
+        assert reads == ["hi"]
+    finally:
+        hub.unregister(a)
+        a.close()
+        b.close()
+
+def test_reads_pause_at_input_limit():
+    state = {'max': 0}
+    done = Event()
+    def handler(addr):
+        set_input_limit(LIMIT)
+        buf = core.current_loop.connection_stack[-1].buffer
+        sleep(0.3) # a busy loop, not reading
+        state['max'] = buf.size
+        got = 0
+        while got < TOTAL:
+            got += len(receive())
+            state['max'] = max(state['max'], buf.size)
+        state['got'] = got
+        done.set()
+    service = Service(handler, 0)
+    runtime.current_app.add_service(service)
+
+    def write_all():
+        sock = socket.create_connection(('localhost', service.port))
+        sock.sendall('x' * TOTAL)
+        return sock
+    sock = thread(write_all)
+    done.wait()
+    sock.close()
+    assert state['got'] == TOTAL
+    assert state['max'] < LIMIT + BUFSIZ, state
+
+def test_hangup_while_paused_keeps_unread_data():
+    a, b = socket.socketpair()
+    a.setblocking(0)
+    b.setblocking(0)
+    conn = core.Connection(a, 'pair')
+    conn.set_input_limit(LIMIT)
+    # send as much as the kernel will hold beyond what's read
+    sent = 0
+    for i in xrange(100):
+        try:
+            sent += b.send('x' * LIMIT)
+        except socket.error:
+            sleep(0.01)
+    data = 'x' * sent
+    assert conn._reads_paused
+    # the peer is gone, with most of what it sent still in the kernel
+    b.close()
+    sleep(0.05)
+    assert not conn.closed
+    got = []
+    loop = core.current_loop
+    loop.connection_stack.append(conn)
+    try:
+        while True:
+            try:
+                got.append(receive())
+            except core.ConnectionClosed, e:
+                got.append(e.buffer)
+                break
+    finally:
+        loop.connection_stack.pop()
+    assert ''.join(got) == data
@@ -0,0 +1,62 @@
+from cStringIO import StringIO
+
+import diesel
+from diesel.util.event import Event
+from diesel.util.sampling import SamplingProfiler
+
+def spin(n):
+    x = 0
+    for i in xrange(n):
+        x += i
+    return x
+
+def busy(done):
+    diesel.label('busy;loop')
+    for i in xrange(20):
+        spin(50000)
+        diesel.sleep()
+    done.set()
+
+class TestSamplingProfiler(object):
+    def setup(self):
+        self.profiler = SamplingProfiler(interval=0.001)
+
+    def teardown(self):
+        self.profiler.stop()
+
+    def run_busy(self):
+        self.profiler.start()
+        done = Event()
+        diesel.fork(busy, done)
+        done.wait()
+        self.profiler.stop()
+
+    def test_samples_are_filed_under_the_loop_label(self):
+        self.run_busy()
+        assert self.profiler.samples > 0
+        lines = self.profiler.collapsed()
+        busy_lines = [l for l in lines if l.startswith('busy:loop;')]
+        assert busy_lines, lines
+        assert any(';spin (' in l for l in busy_lines)
+        # stacks stop at the loop's greenlet: run() is the outermost frame
+        for l in busy_lines:
+            assert l.split(';')[1].startswith('run ('), l
+
+    def test_collapsed_format(self):
+        self.run_busy()
+        out = StringIO()
+        self.profiler.write_collapsed(out)
+        lines = out.getvalue().splitlines()
+        total = 0
+        for l in lines:
+            stack, count = l.rsplit(' ', 1)
+            total += int(count)
+        assert total == self.profiler.samples
+
+    def test_stop_stops_sampling(self):
+        self.run_busy()
+        n = self.profiler.samples
+        spin(500000)
+        assert self.profiler.samples == n
+        self.profiler.reset()
+        assert not self.profiler.collapsed()
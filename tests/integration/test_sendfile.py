@@ -0,0 +1,50 @@
+import tempfile
+
+import diesel
+from diesel import Client, Service, FileRange, call, send, until, runtime
+
+SIZE = 3 * 2 ** 20
+
+def make_file():
+    f = tempfile.TemporaryFile()
+    for i in xrange(SIZE // 16):
+        f.write("%015d\n" % i)
+    f.seek(0)
+    return f
+
+class FileClient(Client):
+    @call
+    def fetch(self, request, size):
+        send(request)
+        return until(size)
+
+def serve(f):
+    def handle(addr):
+        while True:
+            request = until("\n").split()
+            if request[0] == 'all':
+                send(f)
+            else:
+                send(FileRange(f, int(request[1]), int(request[2])))
+    service = Service(handle, 0)
+    runtime.current_app.add_service(service)
+    return service
+
+def test_send_file():
+    f = make_file()
+    expected = f.read()
+    f.seek(0)
+    service = serve(f)
+    client = FileClient('localhost', service.port)
+    assert client.fetch("all\n", SIZE) == expected
+    client.close()
+
+def test_send_file_range():
+    f = make_file()
+    expected = f.read()
+    service = serve(f)
+    client = FileClient('localhost', service.port)
+    for offset, length in [(0, 10), (12345, 2 ** 20), (SIZE - 16, 16)]:
+        got = client.fetch("range %d %d\n" % (offset, length), length)
+        assert got == expected[offset:offset + length]
+    client.close()
@@ -48,3 +48,15 @@ def test_sleep_zero():
     sleep() # allow i to get scheduled
     now = v[0]
     assert (now == cur + 1)
+
+def test_coarse_timer():
+    from diesel import runtime
+    hub = runtime.current_app.hub
+    v = []
+    hub.call_later_coarse(0.2, v.append, 'fired')
+    cancelled = hub.call_later_coarse(0.2, v.append, 'cancelled')
+    cancelled.cancel()
+    sleep(0.1)
+    assert v == []
+    sleep(0.1 + 2 * hub.coarse_timers.resolution)
+    assert v == ['fired'], v
@@ -0,0 +1,87 @@
+import os
+import time
+
+import diesel
+from diesel import fork, thread, runtime
+from diesel.hub import WorkerPool
+from diesel.util.event import Countdown
+
+def test_thread_result():
+    assert thread(lambda x: x * 2, 21) == 42
+
+def test_thread_exception():
+    def boom():
+        raise ValueError("boom")
+    try:
+        thread(boom)
+    except ValueError:
+        pass
+    else:
+        assert 0, "exception was not raised in the calling loop"
+
+def test_threads_are_reused():
+    pool = runtime.current_app.hub.thread_pool
+    for i in xrange(pool.size * 2):
+        thread(time.sleep, 0)
+    assert pool.threads <= pool.size
+    assert pool.stats()['completed'] >= pool.size * 2
+
+def test_queue_limit_holds_back_jobs():
+    hub = runtime.current_app.hub
+    old = hub.thread_pool
+    hub.thread_pool = WorkerPool(hub, 2, max_queued=1)
+    try:
+        N = 10
+        done = Countdown(N)
+        results = []
+        def call(i):
+            results.append(thread(lambda: (time.sleep(0.01), i)[1]))
+            done.tick()
+        for i in xrange(N):
+            fork(call, i)
+        diesel.sleep()
+        assert hub.thread_pool.stats()['backlog'] > 0
+        ev, _ = diesel.first(sleep=5, waits=[done])
+        assert ev == done, "timed out"
+        assert sorted(results) == range(N)
+        stats = hub.thread_pool.stats()
+        assert stats['backlog'] == 0 and stats['completed'] == N
+        assert hub.thread_pool.threads <= 2
+    finally:
+        hub.thread_pool = old
+
+def test_completion_during_wakeup_drain():
+    # a worker finishing just as the hub reads the wakeup descriptor must
+    # not leave later completions waiting for unrelated I/O
+    hub = runtime.current_app.hub
+    real_read = os.read
+    def racing_read(fd, n):
+        if fd == hub._t_recv:
+            os.read = real_read
+            hub.schedule_from_other_thread(lambda v: None, None)
+        return real_read(fd, n)
+    os.read = racing_read
+    try:
+        thread(time.sleep, 0)
+    finally:
+        os.read = real_read
+    done = Countdown(1)
+    def call():
+        thread(time.sleep, 0)
+        done.tick()
+    fork(call)
+    ev, _ = diesel.first(sleep=2, waits=[done])
+    assert ev == done, "completion was stranded"
+
+def test_many_concurrent_completions():
+    N = 50
+    CALLS = 100
+    done = Countdown(N)
+    def call():
+        for i in xrange(CALLS):
+            thread(lambda: i)
+        done.tick()
+    for i in xrange(N):
+        fork(call)
+    ev, _ = diesel.first(sleep=30, waits=[done])
+    assert ev == done, "timed out"
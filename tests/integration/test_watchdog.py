@@ -0,0 +1,65 @@
+import time
+
+import diesel
+from diesel.util.event import Event
+from diesel.util.watchdog import StallWatchdog
+
+def blocker(done):
+    diesel.label('blocking-loop')
+    time.sleep(0.2)
+    done.set()
+
+def clock_reading_blocker(done):
+    diesel.label('clock-reading-loop')
+    hub = diesel.runtime.current_app.hub
+    end = time.time() + 0.2
+    while time.time() < end:
+        hub.update_now()
+        hub.call_later(10, done.set).cancel()
+    done.set()
+
+class TestStallWatchdog(object):
+    def setup(self):
+        self.watchdog = StallWatchdog(threshold=0.05)
+        self.reports = []
+        report = self.watchdog.report
+        def record(stalled):
+            self.reports.append(self.watchdog.running_stack())
+            report(stalled)
+        self.watchdog.report = record
+        self.watchdog.start()
+
+    def teardown(self):
+        self.watchdog.stop()
+
+    def test_idle_hub_is_not_a_stall(self):
+        diesel.sleep(0.2)
+        assert not self.watchdog.stalls
+
+    def test_blocking_loop_is_reported(self):
+        done = Event()
+        diesel.fork(blocker, done)
+        done.wait()
+        assert dict(self.watchdog.stalls) == {'blocking-loop': 1}
+        label, stack = self.reports[0]
+        assert label == 'blocking-loop'
+        assert 'time.sleep(0.2)' in stack
+
+    def test_reading_the_clock_is_not_a_heartbeat(self):
+        done = Event()
+        diesel.fork(clock_reading_blocker, done)
+        done.wait()
+        assert dict(self.watchdog.stalls) == {'clock-reading-loop': 1}
+
+    def test_blocking_in_the_hub_is_reported(self):
+        hub = diesel.runtime.current_app.hub
+        hub.schedule(lambda: time.sleep(0.2))
+        diesel.sleep(0.01)
+        assert dict(self.watchdog.stalls) == {'<hub>': 1}
+
+    def test_stop(self):
+        self.watchdog.stop()
+        done = Event()
+        diesel.fork(blocker, done)
+        done.wait()
+        assert not self.watchdog.stalls
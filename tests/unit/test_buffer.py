@@ -1,4 +1,4 @@
-from diesel.buffer import Buffer
+from diesel.buffer import Buffer, BufferLimitExceeded
 
 def test_feed():
     b = Buffer()
@@ -41,3 +41,52 @@ def test_read_hybrid():
     assert b.check() == None
     assert b.feed("9abcdefgh") == "0123456789abcdef"
 
+
+def test_sentinel_split_across_feeds():
+    b = Buffer()
+    b.set_term("\r\n")
+    assert b.feed("abc\r") == None
+    assert b.feed("\ndef") == "abc\r\n"
+    b.set_term("\r\n")
+    assert b.feed("\r") == None
+    b.set_term("\r\n") # re-setting the same term keeps the scan position
+    assert b.feed("\n") == "def\r\n"
+
+def test_max_length():
+    b = Buffer()
+    b.set_term("\r\n", max_length=10)
+    assert b.feed("12345") == None
+    try:
+        b.feed("678901")
+    except BufferLimitExceeded:
+        pass
+    else:
+        assert 0, "limit not enforced"
+
+def test_max_length_counts_sentinel():
+    b = Buffer()
+    b.set_term("\r\n", max_length=10)
+    assert b.feed("12345678\r\n") == "12345678\r\n"
+    b.set_term("\r\n", max_length=10)
+    try:
+        b.feed("123456789\r\n")
+    except BufferLimitExceeded:
+        pass
+    else:
+        assert 0, "limit not enforced"
+
+def test_read_many_small_messages():
+    b = Buffer()
+    assert b.feed("".join("%05d" % i for i in xrange(1000))) == None
+    for i in xrange(1000):
+        b.set_term(5)
+        assert b.check() == "%05d" % i
+    assert not b.has_data
+
+def test_long_until_scan():
+    b = Buffer()
+    b.set_term("\r\n")
+    for i in xrange(4000):
+        assert b.feed("x" * 512) == None
+    assert len(b.feed("\r\n")) == 4000 * 512 + 2
+    assert not b.has_data
@@ -1,6 +1,6 @@
 #12345678
 # That comment above matters (used in the test!)
-from diesel.pipeline import Pipeline, PipelineClosed, PipelineCloseRequest
+from diesel.pipeline import Pipeline, PipelineClosed, PipelineCloseRequest, FileRange
 from cStringIO import StringIO
 
 FILE = __file__
@@ -148,3 +148,142 @@ def test_pri_clean():
     p.add("six", 2)
     p.add("one", 1)
     assert (p.read(18) == "threetwosixone")
+
+def test_read_buffers():
+    p = Pipeline()
+    p.add("foo")
+    p.add("bar")
+    p.add(StringIO("baz"))
+    assert (p.read_buffers(1000) == ["foobar", "baz"])
+    # nothing is consumed until we say so
+    assert (p.read_buffers(4) == ["foob"])
+    p.consume(4)
+    assert (p.read_buffers(1000) == ["ar", "baz"])
+    p.consume(5)
+    assert (p.empty)
+    assert (p.read_buffers(1000) == [])
+
+def test_large_strings_not_copied():
+    p = Pipeline()
+    big = "x" * 100000
+    p.add("header")
+    p.add(big)
+    bufs = p.read_buffers(200000)
+    assert (bufs[0] == "header")
+    assert (bufs[1] is big)
+
+def test_consume_across_items():
+    p = Pipeline()
+    p.add("foo", 1)
+    p.add(open(FILE), 1)
+    p.add("bar", 1)
+    assert (''.join(p.read_buffers(8)) == "foo#1234")
+    p.consume(6)
+    assert (p.read(5) == "34567")
+    p.close_request()
+    p.consume(len(''.join(p.read_buffers(100000))))
+    try:
+        p.read_buffers(1000)
+    except PipelineCloseRequest:
+        pass
+    else:
+        assert 0, "expected close request"
+
+def test_bench_many_small_sends():
+    # Redis-style: lots of small strings queued, then written out in
+    # socket-sized batches, some of which are only partly accepted
+    p = Pipeline()
+    for i in xrange(50000):
+        p.add("$5\r\n%05d\r\n" % i)
+    total = 0
+    while not p.empty:
+        bufs = p.read_buffers(16384)
+        n = len(''.join(bufs))
+        if n > 7:
+            n -= 7
+        p.consume(n)
+        total += n
+    assert (total == 50000 * 11)
+
+def test_read_file_range():
+    p = Pipeline()
+    p.add(FileRange(open(FILE), 1, 4))
+    p.add(FileRange(StringIO('abcdef'), 2))
+    assert (p.read(1000) == "1234cdef")
+    assert (p.empty)
+
+def test_front_file():
+    p = Pipeline()
+    f = open(FILE)
+    p.add("foo")
+    p.add(FileRange(f, 1, 4))
+    p.add(StringIO("bar"))
+    assert (p.front_file() == None)
+    # a file on disk isn't read in behind the data ahead of it
+    assert (p.read_buffers(1000, files=False) == ["foo"])
+    p.consume(3)
+    assert (p.front_file() == (f.fileno(), 1, 4))
+    p.consume(2)
+    assert (p.front_file() == (f.fileno(), 3, 2))
+    p.consume(2)
+    # not a real file, so it has to be read
+    assert (p.front_file() == None)
+    assert (p.read(1000) == "bar")
+
+def test_file_ended():
+    p = Pipeline()
+    f = open(FILE)
+    p.add(FileRange(f, 0, 10 ** 9))
+    p.add("foo")
+    assert (p.front_file() == (f.fileno(), 0, 10 ** 9))
+    p.file_ended()
+    assert (p.front_file() == None)
+    assert (p.read(1000) == "foo")
+
+def test_priority_order_with_backup():
+    p = Pipeline()
+    p.add(StringIO("low"), 1)
+    p.add("high", 9)
+    p.add(StringIO("mid"), 5)
+    p.add("-mid", 5)
+    p.add("-high", 9)
+    assert (p.read(6) == "high-h")
+    p.backup("H")
+    assert (p.read(1000) == "Highmid-midlow")
+    assert (p.empty)
+
+def test_priority_after_front_used_up():
+    p = Pipeline()
+    p.add("low", 1)
+    p.add("HI", 5)
+    assert (p.read(2) == "HI")
+    p.add("HI2", 5)
+    assert (p.read(3) == "HI2")
+    assert (p.read(1000) == "low")
+    assert (p.empty)
+
+def test_bench_many_queued_items():
+    # items that can't be merged, across a few priorities, queued up
+    # faster than they drain (think a fanout to a slow subscriber)
+    N = 20000
+    p = Pipeline()
+    for i in xrange(N):
+        p.add(StringIO("%05d" % i), i % 3)
+        p.add("x", i % 3)
+    total = 0
+    while not p.empty:
+        total += len(p.read(4096))
+    assert (total == N * 6)
+
+def test_size_counts_queued_strings():
+    p = Pipeline()
+    p.add("foo")
+    p.add("bar")
+    p.add(StringIO("not counted"), 1)
+    assert (p.size == 6)
+    assert (p.read(4) == "foob")
+    assert (p.size == 2)
+    p.backup("ob")
+    assert (p.size == 4)
+    p.read(1000)
+    assert (p.size == 0)
@@ -0,0 +1,85 @@
+import time
+
+from diesel.util.stats import CPUAccounting, Histogram, HubMetrics
+
+def handler():
+    pass
+
+def test_time_is_charged_to_labels():
+    acct = CPUAccounting()
+    acct.add('a', time.time() - 0.5)
+    acct.add('b', time.time() - 0.25)
+    acct.add('a', time.time() - 0.5)
+    top = acct.top()
+    assert [label for label, seconds in top] == ['a', 'b']
+    assert 0.9 < top[0][1] < 1.5
+
+class Handler(object):
+    def __call__(self):
+        pass
+
+def test_callables_are_labelled_with_str():
+    acct = CPUAccounting()
+    acct.add(handler, time.time() - 0.1)
+    acct.add(str(handler), time.time() - 0.1)
+    totals = acct.totals()
+    assert totals.keys() == ['<function handler>']
+    assert totals['<function handler>'] > 0.19
+
+def test_instances_add_up_under_one_label():
+    acct = CPUAccounting()
+    # kept alive, so each has its own address
+    handlers = [Handler() for i in xrange(3)]
+    for h in handlers:
+        acct.add(h, time.time() - 0.1)
+    totals = acct.totals()
+    assert len(totals) == 1, totals
+    assert totals.values()[0] > 0.29
+
+def test_top_n():
+    acct = CPUAccounting()
+    for i in xrange(20):
+        acct.add('loop %d' % i, time.time() - i * 0.01)
+    assert [label for label, seconds in acct.top(3)] == [
+            'loop 19', 'loop 18', 'loop 17']
+
+def test_window_drops_old_buckets():
+    acct = CPUAccounting(bucket=0.01)
+    acct.add('old', time.time() - 1)
+    time.sleep(0.05)
+    acct.add('new', time.time() - 0.1)
+    assert acct.slices
+    assert 'old' in acct.totals(window=10)
+    assert acct.totals(window=0.02).keys() == ['new']
+
+def test_history_is_bounded():
+    acct = CPUAccounting(bucket=0.001, history=0.005)
+    for i in xrange(20):
+        time.sleep(0.002)
+        acct.add('x', time.time())
+    assert len(acct.slices) == 5
+
+def test_histogram_buckets():
+    h = Histogram()
+    for v in (0.0000005, 0.000003, 0.000003, 0.001):
+        h.record(v)
+    assert h.count == 4
+    assert h.buckets[0] == 1
+    assert h.buckets[2] == 2
+    assert h.max == 0.001
+    assert h.percentile(50) == 4e-6
+    assert h.percentile(100) == 0.001
+
+def test_empty_histogram():
+    summary = Histogram().summary()
+    assert summary['count'] == 0
+    assert summary['mean'] == summary['p99'] == 0
+
+def test_hub_metrics_counts_are_unscaled():
+    metrics = HubMetrics()
+    metrics.run_queue.record(3)
+    metrics.poll_time.record(0.000003)
+    assert metrics.run_queue.buckets[2] == 1
+    assert metrics.poll_time.buckets[2] == 1
+    metrics.reset()
+    assert metrics.summary()['run_queue']['count'] == 0
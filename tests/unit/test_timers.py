@@ -0,0 +1,94 @@
+import time
+
+from diesel.hub import Timer, TimerHeap, TimingWheel, CoarseTimer
+from diesel.syscall import monotonic
+
+class FakeHub(object):
+    def __init__(self):
+        self.now = monotonic()
+        self._wall_offset = self.now - time.time()
+        self.timers = TimerHeap()
+        self.coarse_timers = TimingWheel(0.1)
+
+    def update_now(self):
+        return self.now
+
+    def remove_timer(self, t):
+        self.timers.discard(t)
+
+def noop():
+    pass
+
+def test_heap_orders_by_trigger_time():
+    hub = FakeHub()
+    ts = [Timer(hub, i, noop) for i in (5, 1, 3)]
+    for t in ts:
+        t.inq = True
+        hub.timers.push(t)
+    assert [hub.timers.pop() for x in xrange(3)] == [ts[1], ts[2], ts[0]]
+    assert not hub.timers
+
+def test_timer_is_based_on_the_current_time():
+    hub = FakeHub()
+    # a loop that ran for a while since the hub last read its clock
+    hub.now -= 1
+    t = Timer(hub, 5, noop)
+    assert 5.9 < t.trigger_time - hub.now < 6.1
+    assert not t.due
+
+def test_heap_skips_cancelled():
+    hub = FakeHub()
+    ts = [Timer(hub, i, noop) for i in (1, 2, 3)]
+    for t in ts:
+        t.inq = True
+        hub.timers.push(t)
+    ts[0].cancel()
+    assert len(hub.timers) == 2
+    assert hub.timers.peek() is ts[1]
+    ts[1].cancel()
+    ts[2].cancel()
+    assert not hub.timers
+    assert hub.timers.peek() is None
+
+def test_heap_compacts():
+    hub = FakeHub()
+    ts = [Timer(hub, 10, noop) for i in xrange(TimerHeap.COMPACT_MIN * 3)]
+    for t in ts:
+        t.inq = True
+        hub.timers.push(t)
+    for t in ts[:-1]:
+        t.cancel()
+    assert len(hub.timers.heap) < TimerHeap.COMPACT_MIN * 3
+    assert hub.timers.pop() is ts[-1]
+
+def test_wheel_fires_after_interval():
+    hub = FakeHub()
+    wheel = hub.coarse_timers
+    t = CoarseTimer(hub, 0.35, noop)
+    t.inq = True
+    wheel.add(t)
+    assert wheel.advance(t.trigger_time - 0.1) == []
+    assert wheel.advance(t.trigger_time + 0.1) == [t]
+    assert not wheel
+
+def test_wheel_cancel():
+    hub = FakeHub()
+    wheel = hub.coarse_timers
+    t = CoarseTimer(hub, 0.2, noop)
+    t.inq = True
+    wheel.add(t)
+    assert len(wheel) == 1
+    t.cancel()
+    assert not wheel
+    assert wheel.advance(t.trigger_time + 1) == []
+
+def test_wheel_handles_multiple_rounds():
+    hub = FakeHub()
+    wheel = hub.coarse_timers
+    # far enough out to wrap around the wheel more than once
+    interval = len(wheel.slots) * wheel.resolution * 2.5
+    t = CoarseTimer(hub, interval, noop)
+    t.inq = True
+    wheel.add(t)
+    assert wheel.advance(t.trigger_time - interval / 2) == []
+    assert wheel.advance(t.trigger_time + 0.2) == [t]
@@ -54,9 +54,76 @@ class TestWaitPoolWithStringWaiter(object):
         w = self.pool.waits[self.wait_for].pop()
         assert w is self.who
 
-    def test_StringWaiter_added_to_wait_pool(self):
+    def test_string_itself_is_the_loop_ref(self):
         v = self.pool.loop_refs[self.who].pop()
-        assert isinstance(v, StringWaiter)
+        assert type(v) is str
+        assert v == self.wait_for
 
     def test_result_is_wait_id(self):
         assert self.result == self.wait_for
+
+    def test_result_is_interned(self):
+        assert self.result is intern("a " + "string"[:])
+
+class Handler(object):
+    """A stand-in for a loop that records what was fired at it."""
+    def __init__(self):
+        self.fire_due = False
+        self.fired = []
+
+    def fire_in(self, what, value):
+        self.fired.append((what, value))
+
+class TestWaitPoolBookkeeping(object):
+    def setup(self):
+        self.pool = WaitPool()
+
+    def test_firing_without_waiters_stores_nothing(self):
+        for i in xrange(100):
+            self.pool.fire("event-%d" % i, i)
+            self.pool.fire(Waiter(), i)
+        assert not self.pool.waits
+        assert not self.pool.loop_refs
+
+    def test_clear_drops_empty_sets(self):
+        who = Handler()
+        other = Handler()
+        waiter = Waiter()
+        self.pool.wait(who, "shared")
+        self.pool.wait(other, "shared")
+        self.pool.wait(who, waiter)
+        self.pool.clear(who)
+        assert self.pool.waits == {"shared": set([other])}
+        assert who not in self.pool.loop_refs
+        self.pool.clear(other)
+        assert not self.pool.waits
+        assert not self.pool.loop_refs
+
+    def test_clear_without_waits(self):
+        self.pool.clear(Handler())
+        assert not self.pool.loop_refs
+
+    def test_fire_reaches_string_and_waiter_waits(self):
+        who = Handler()
+        waiter = Waiter()
+        self.pool.wait(who, "ev")
+        self.pool.wait(who, waiter)
+        self.pool.fire("ev", 1)
+        self.pool.fire(waiter, 2)
+        assert who.fired == [("ev", 1), (waiter.wait_id, 2)]
+
+    def test_fire_skips_handlers_already_due(self):
+        who = Handler()
+        who.fire_due = True
+        self.pool.wait(who, "ev")
+        self.pool.fire("ev", 1)
+        assert who.fired == []
+
+class TestWaiterIds(object):
+    def test_wait_id_is_cached(self):
+        w = Waiter()
+        assert w.wait_id is w.wait_id
+
+    def test_wait_ids_differ(self):
+        w1, w2 = Waiter(), Waiter()
+        assert w1.wait_id != w2.wait_id